@@ -0,0 +1,83 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+# dpkg-query output format used to find out installed packages
+DPKG_QUERY_FORMAT = '${Package} ${Status}\\n'
+
+# Sources list of the local repository, used instead of the tasks' repositories when configured
+LOCAL_SOURCES_LIST = '/etc/apt/sources.list.d/dev-workstation-installer.list'
+
+# Directory of the hosts receiving the apt bundle built by the apt_bundle task
+BUNDLE_DIRECTORY = '/var/cache/dev-workstation-installer/apt'
+
+
+class AptPlan(object):
+    """Repositories, keys and packages of several tasks, installed in a single apt transaction"""
+
+    def __init__(self):
+        self.prerequisites = []
+        self.keys = []
+        self.ppas = []
+        self.sources = []
+        self.packages = []
+
+    def add_prerequisites(self, *packages):
+        _extend(self.prerequisites, packages)
+
+    def add_key(self, url):
+        _extend(self.keys, [url])
+
+    def add_ppa(self, ppa):
+        _extend(self.ppas, [ppa])
+
+    def add_source(self, list_name, line):
+        _extend(self.sources, [(list_name, line)])
+
+    def add_packages(self, *packages):
+        _extend(self.packages, packages)
+
+    def key_commands(self, use_proxy=False):
+        wget = "wget -qO -"
+        if use_proxy:
+            wget = wget + " -e use_proxy=yes -e http_proxy=$http_proxy"
+        return ["%s %s | sudo apt-key add -" % (wget, url) for url in self.keys]
+
+    def repository_commands(self):
+        commands = ["apt-add-repository -y ppa:%s" % ppa for ppa in self.ppas]
+        commands.extend('echo "%s" > /etc/apt/sources.list.d/%s.list' % (line, list_name)
+                        for list_name, line in self.sources)
+        return commands
+
+
+def local_repository_commands(url):
+    """Commands pointing apt at a flat repository and refreshing its index only"""
+    return ['echo "deb [trusted=yes] %s ./" > %s' % (url, LOCAL_SOURCES_LIST),
+            'apt-get update -o Dir::Etc::sourcelist=%s -o Dir::Etc::sourceparts=- -o APT::Get::List-Cleanup=0'
+            % LOCAL_SOURCES_LIST]
+
+
+def bundle_commands(packages):
+    """Commands downloading packages with all their dependencies into the current directory, then indexing it"""
+    depends = ('apt-cache depends --recurse --no-recommends --no-suggests --no-conflicts --no-breaks --no-replaces '
+               '--no-enhances %s | grep "^[a-z0-9]" | sort -u' % ' '.join(packages))
+    # apt-get download fails as a whole on a single package without candidate, those are then skipped one by one
+    return ['packages=$(%s) && { apt-get download $packages || '
+            'for package in $packages; do apt-get download $package || true; done; }' % depends,
+            'apt-ftparchive packages . > Packages && gzip -9c Packages > Packages.gz && '
+            'apt-ftparchive release . > Release']
+
+
+def missing_packages(packages, dpkg_output):
+    """Packages which dpkg-query does not report as installed"""
+    installed = set()
+    for line in dpkg_output.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[-1] == 'installed':
+            installed.add(fields[0].split(':')[0])
+    return [package for package in packages if package not in installed]
+
+
+def _extend(items, new_items):
+    for item in new_items:
+        if item not in items:
+            items.append(item)
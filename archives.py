@@ -0,0 +1,31 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+
+def extract_command(source, directory, extracted, sha256=None):
+    """Shell command piping the output of source into tar, then moving directory/extracted into place
+
+    The archive is extracted into a temporary directory next to its destination, which replaces the previous
+    version only once the whole stream has been read successfully and, when sha256 is given, has the expected hash.
+    """
+    partial = '%s/.partial-%s' % (directory, extracted)
+    target = '%s/%s' % (directory, extracted)
+
+    steps = ['set -o pipefail', 'rm -rf %s %s.fifo %s.sha256' % (partial, partial, partial), 'mkdir -p %s' % partial]
+    if sha256 is None:
+        steps.append('%s | tar xzf - -C %s' % (source, partial))
+    else:
+        steps.extend([
+            'mkfifo %s.fifo' % partial,
+            '{ sha256sum < %s.fifo > %s.sha256 & }' % (partial, partial),
+            '%s | tee %s.fifo | tar xzf - -C %s' % (source, partial, partial),
+            'wait',
+            'test "$(cut -d" " -f1 %s.sha256)" = "%s"' % (partial, sha256),
+        ])
+    steps.extend([
+        'rm -rf %s.old' % target,
+        '{ [ ! -e %s ] || mv %s %s.old; }' % (target, target, target),
+        'mv %s/%s %s' % (partial, extracted, target),
+        'rm -rf %s %s.fifo %s.sha256 %s.old' % (partial, partial, partial, target),
+    ])
+    return '%s || { rm -rf %s %s.fifo %s.sha256; false; }' % (' && '.join(steps), partial, partial, partial)
@@ -0,0 +1,182 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+
+import downloads
+
+try:
+    from urllib2 import build_opener, ProxyHandler
+except ImportError:
+    from urllib.request import build_opener, ProxyHandler
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ChecksumError(Exception):
+    pass
+
+
+class ArtefactCache(object):
+    """Downloaded artefacts kept on the controller, keyed by URL and stored by SHA-256"""
+
+    def __init__(self, directory, max_size, segment_threshold=None, segments=1):
+        self.directory = directory
+        self.max_size = max_size
+        self.segment_threshold = segment_threshold
+        self.segments = segments
+        self.objects_directory = os.path.join(directory, 'objects')
+        self.index_path = os.path.join(directory, 'index.json')
+        if not os.path.isdir(self.objects_directory):
+            os.makedirs(self.objects_directory)
+
+    def fetch(self, url, sha256=None, proxies=None, sources=None, rate=None):
+        """Local path of the artefact, downloaded only when it is not in the cache yet
+
+        The artefact is downloaded from the first of sources (by default url itself) which succeeds, each of its
+        connections limited to rate bytes per second when given.
+        """
+        with self._lock('url-' + hashlib.sha1(url.encode('utf-8')).hexdigest()):
+            path = self.lookup(url, sha256)
+            if path is not None:
+                return path
+
+            for source in sources or [url]:
+                try:
+                    path, digest, size = self._download(source, proxies, rate)
+                except Exception as e:
+                    error = e
+                    logging.warning('Download of %s failed: %s' % (source, e))
+                    continue
+                if sha256 is not None and digest != sha256:
+                    os.remove(path)
+                    error = ChecksumError('%s: expected sha256 %s, got %s' % (source, sha256, digest))
+                    logging.warning(str(error))
+                    continue
+                break
+            else:
+                raise error
+            object_path = os.path.join(self.objects_directory, digest)
+            os.rename(path, object_path)
+
+            with self._index() as index:
+                index[url] = {'sha256': digest, 'size': size, 'last_used': time.time()}
+                self._evict(index, keep=url)
+            return object_path
+
+    def lookup(self, url, sha256=None):
+        """Local path of a cached artefact, None when it is missing or does not match the expected hash"""
+        with self._index() as index:
+            entry = index.get(url)
+            if entry is None or (sha256 is not None and entry['sha256'] != sha256):
+                return None
+            path = os.path.join(self.objects_directory, entry['sha256'])
+            if not os.path.exists(path):
+                del index[url]
+                return None
+            entry['last_used'] = time.time()
+            return path
+
+    def entries(self):
+        with self._index() as index:
+            return dict(index)
+
+    def _download(self, url, proxies, rate=None):
+        if self.segment_threshold is not None and self.segments > 1:
+            size, accepts_ranges = downloads.head(url, proxies)
+            if accepts_ranges and size is not None and size >= self.segment_threshold:
+                return self._download_segments(url, size, proxies, rate)
+
+        opener = build_opener(ProxyHandler(proxies or {}))
+        digest = hashlib.sha256()
+        size = 0
+        start = time.time()
+        # Named after the URL, and written under its lock, so that the file left by a killed run is overwritten by
+        # the next download instead of piling up
+        path = os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.part')
+        try:
+            with open(path, 'wb') as f:
+                response = opener.open(url)
+                try:
+                    chunk = response.read(CHUNK_SIZE)
+                    while chunk:
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+                        downloads.throttle(start, size, rate)
+                        chunk = response.read(CHUNK_SIZE)
+                finally:
+                    response.close()
+            # A connection closed early ends the reads without an error
+            length = response.info().get('Content-Length')
+            if length is not None and size != int(length):
+                raise IOError('%s: %d of %s bytes received' % (url, size, length))
+        except BaseException:
+            # Interrupted runs included
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        logging.info('Downloaded %s (%d bytes) in %.1fs' % (url, size, time.time() - start))
+        return path, digest.hexdigest(), size
+
+    def _download_segments(self, url, size, proxies, rate=None):
+        # Parts are kept under a name derived from the URL, so that an interrupted download is resumed
+        path = os.path.join(self.directory, 'partial', hashlib.sha1(url.encode('utf-8')).hexdigest())
+        start = time.time()
+        downloads.download(url, path, size, self.segments, proxies, rate)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            chunk = f.read(CHUNK_SIZE)
+            while chunk:
+                digest.update(chunk)
+                chunk = f.read(CHUNK_SIZE)
+        logging.info('Downloaded %s (%d bytes) in %d segments in %.1fs' % (url, size, self.segments,
+                                                                          time.time() - start))
+        return path, digest.hexdigest(), size
+
+    def _evict(self, index, keep):
+        """Remove least recently used artefacts until the cache fits in max_size"""
+        total = sum(entry['size'] for entry in index.values())
+        for url, entry in sorted(index.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_size:
+                break
+            if url == keep:
+                continue
+            del index[url]
+            total -= entry['size']
+            if not any(other['sha256'] == entry['sha256'] for other in index.values()):
+                path = os.path.join(self.objects_directory, entry['sha256'])
+                if os.path.exists(path):
+                    os.remove(path)
+            logging.info('Evicted %s from artefact cache' % url)
+
+    @contextmanager
+    def _index(self):
+        with self._lock('index'):
+            index = {}
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+            yield index
+            fd, path = tempfile.mkstemp(dir=self.directory, suffix='.json')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+            shutil.move(path, self.index_path)
+
+    @contextmanager
+    def _lock(self, name):
+        with open(os.path.join(self.directory, name + '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
@@ -0,0 +1,119 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import posixpath
+from collections import namedtuple
+
+# install_path is the directory (or the jar in the jar store) the installer of the artefact creates on the host
+Artefact = namedtuple('Artefact', ['name', 'url', 'filename', 'sha256', 'install_path'])
+
+# Artefacts downloaded by each installer task
+TASK_ARTEFACTS = {
+    'maven_install': ['maven'],
+    'ant_install': ['ant'],
+    'liquibase_install': ['liquibase', 'postgres.driver'],
+    'schemacrawler_install': ['schemacrawler'],
+    'intellij_install': ['intellij'],
+    'datagrip_install': ['datagrip'],
+    'apache_directory_studio_install': ['ads'],
+    'apache_tomcat_install': ['tomcat', 'postgres.driver', 'h2.driver', 'javax.mail', 'jt400.driver', 'activation'],
+    'bfg_repo_cleaner_install': ['bfg_cleaner'],
+    'fakeSMTP_install': ['fakeSMTP'],
+}
+
+# Jars used by several installers, fetched once into the jar store of the host and linked into their lib directories
+JARS = ['postgres.driver', 'h2.driver', 'jt400.driver', 'javax.mail', 'activation']
+JAR_STORE = 'jars'
+
+
+def _versioned(section, url_key='url', version_key='version'):
+    return section[url_key] % (section[version_key], section[version_key])
+
+
+def _urls(properties):
+    maven = properties['maven']
+    ant = properties['ant']
+    intellij = properties['intellij']
+    datagrip = properties['datagrip']
+    ads = properties['ads']
+    tomcat = properties['tomcat']
+    driver = properties['driver']
+    return {
+        'maven': maven['url'] % (maven['version'], maven['artefact'] % maven['version']),
+        'ant': ant['url'] % (ant['artefact'] % ant['version']),
+        'liquibase': _versioned(properties['liquibase']),
+        'schemacrawler': _versioned(properties['schemacrawler']),
+        'intellij': intellij['url'] % (intellij['artefact'] % intellij['version']),
+        'datagrip': datagrip['url'] % (datagrip['artefact'] % datagrip['version']),
+        'ads': ads['url'] % (ads['version'], ads['artefact'] % ads['version']),
+        'tomcat': tomcat['url'] % (tomcat['major'], tomcat['version'], tomcat['artefact'] % tomcat['version']),
+        'bfg_cleaner': _versioned(properties['bfg_cleaner']),
+        'fakeSMTP': properties['fakeSMTP']['url'],
+        'postgres.driver': _versioned(driver, 'postgres.url', 'postgres.version'),
+        'h2.driver': _versioned(driver, 'h2.url', 'h2.version'),
+        'jt400.driver': _versioned(driver, 'jt400.url', 'jt400.version'),
+        'javax.mail': _versioned(properties['javax.mail']),
+        'activation': _versioned(properties['activation']),
+    }
+
+
+def _install_paths(properties, urls):
+    working_directory = properties['working_directory']
+    paths = {
+        'maven': '/opt/apache-maven-%s' % properties['maven']['version'],
+        'ant': '/opt/apache-ant-%s' % properties['ant']['version'],
+        'liquibase': '/usr/lib/liquibase-%s' % properties['liquibase']['version'],
+        'schemacrawler': '/opt/schemacrawler',
+        'intellij': '%s/%s' % (working_directory, properties['intellij']['build']),
+        'datagrip': '%s/DataGrip-%s' % (working_directory, properties['datagrip']['version']),
+        'ads': '%s/ApacheDirectoryStudio' % working_directory,
+        'tomcat': '%s/apache-tomcat-%s' % (working_directory, properties['tomcat']['version']),
+        'bfg_cleaner': '%s/bfg-repo-cleaner' % working_directory,
+        'fakeSMTP': '%s/fakeSMTP' % working_directory,
+    }
+    for name in JARS:
+        paths[name] = jar_store_path(properties, urls[name])
+    return paths
+
+
+def _sha256(properties, name):
+    # Expected hashes are optional, e.g. 'maven: sha256: ...' or 'driver: postgres.sha256: ...'
+    if name.endswith('.driver'):
+        return properties['driver'].get(name.split('.')[0] + '.sha256')
+    return properties[name].get('sha256')
+
+
+def resolve(properties):
+    """Resolve the URL template and install path of every artefact of the configuration"""
+    urls = _urls(properties)
+    install_paths = _install_paths(properties, urls)
+    return dict((name, Artefact(name, url, posixpath.basename(url), _sha256(properties, name), install_paths[name]))
+                for name, url in urls.items())
+
+
+def expected_sha256(resolved, url):
+    for artefact in resolved.values():
+        if artefact.url == url:
+            return artefact.sha256
+    return None
+
+
+def for_tasks(resolved, task_names):
+    """Artefacts of the resolved ones needed by the given tasks, each listed once"""
+    names = []
+    for task_name in task_names:
+        for name in TASK_ARTEFACTS.get(task_name, []):
+            if name not in names:
+                names.append(name)
+    return [resolved[name] for name in names]
+
+
+def jar_store_path(properties, url):
+    """Path of a jar in the jar store, following the layout of the Maven repository when its URL does"""
+    path = url.split('/maven2/', 1)[1] if '/maven2/' in url else posixpath.basename(url)
+    return '%s/%s/%s' % (properties['working_directory'], JAR_STORE, path)
+
+
+def artifact_id(url):
+    """Name of the jar without its version, e.g. postgresql for .../postgresql/42.1.4/postgresql-42.1.4.jar"""
+    return posixpath.basename(posixpath.dirname(posixpath.dirname(url)))
@@ -0,0 +1,63 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import Queue
+import threading
+import traceback
+from multiprocessing import util
+
+_STOP = object()
+
+
+class Worker(object):
+    """Thread consuming the items put into it, so that the caller does not wait for their processing
+
+    The thread is started on first use in each process, since forked steps do not inherit the one of their parent,
+    and the remaining items are processed when the process exits.
+    """
+
+    def __init__(self, consume, finish=None):
+        self.consume = consume
+        self.finish = finish
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put(item)
+
+    def drain(self):
+        """Process the items put so far, then stop the thread"""
+        if self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._pid = None
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = Queue.Queue()
+            self._thread = threading.Thread(target=self._loop, args=(self._queue,), name='background-worker')
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = os.getpid()
+            # Run on exit by the main process, and by the children of multiprocessing, which skip atexit
+            util.Finalize(self, self.drain, exitpriority=10)
+
+    def _loop(self, queue):
+        while True:
+            item = queue.get()
+            if item is _STOP:
+                if self.finish is not None:
+                    self.finish()
+                return
+            try:
+                self.consume(item)
+            except Exception:
+                # A failed item must not stop the processing of the next ones
+                traceback.print_exc()
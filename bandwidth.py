@@ -0,0 +1,179 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import time
+import heapq
+import shutil
+import tempfile
+import itertools
+import threading
+import contextlib
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+# Address of the scheduler of the controller, inherited by the processes forked for the hosts and their steps
+_address = None
+
+
+def priorities(graph):
+    """Priority of each task of the graph: the length of the longest chain of tasks which have to wait for it
+
+    Downloads of the tasks the most steps depend on, those on the critical path of a host, are granted first.
+    """
+    dependents = dict((name, []) for name in graph)
+    for name, node in graph.items():
+        for dependency in node.get('after', []):
+            dependents.setdefault(dependency, []).append(name)
+
+    depths = {}
+
+    def depth(name):
+        if name not in depths:
+            depths[name] = max([depth(dependent) + 1 for dependent in dependents.get(name, [])] or [0])
+        return depths[name]
+
+    for name in dependents:
+        depth(name)
+    return depths
+
+
+def active():
+    return _address is not None
+
+
+def downloaded(output):
+    """Bytes reported by the @@downloaded lines of a download command, one per file, 0 when it downloaded nothing"""
+    sizes = [line.split(None, 1)[-1].strip() for line in str(output).splitlines() if line.startswith('@@downloaded ')]
+    return sum(int(size) for size in sizes if size.isdigit())
+
+
+class Scheduler(object):
+    """Download slots shared by every host: at most max_connections open through the proxy, highest priority first
+
+    Each connection gets an equal share of budget_kb_s, so that the downloads never exceed it together.
+    """
+
+    def __init__(self, max_connections, budget_kb_s=0):
+        self.max_connections = max_connections
+        self.rate_kb_s = max(1, budget_kb_s // max_connections) if budget_kb_s else None
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._open = 0
+        self._hosts = {}
+
+    def acquire(self, priority, connections):
+        """Wait until the connections can be opened, then return the rate each one is allowed in KB/s"""
+        connections = min(connections, self.max_connections)
+        with self._condition:
+            # Highest priority first, then in the order of the requests
+            request = (tuple(-value for value in priority), next(self._sequence), connections)
+            heapq.heappush(self._waiting, request)
+            while self._waiting[0] is not request or self._open + connections > self.max_connections:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._open += connections
+            self._condition.notify_all()
+        return self.rate_kb_s
+
+    def release(self, host, connections, size, seconds, waited):
+        with self._condition:
+            self._open -= min(connections, self.max_connections)
+            stats = self._hosts.setdefault(host, {'downloads': 0, 'bytes': 0, 'seconds': 0.0, 'waited': 0.0})
+            # Streams, of unknown size, are left out of the throughput
+            if size:
+                stats['downloads'] += 1
+                stats['bytes'] += size
+                stats['seconds'] += seconds
+            stats['waited'] += waited
+            self._condition.notify_all()
+
+    def throughput(self):
+        """Downloads, bytes, seconds spent downloading and waiting for a slot, by host"""
+        with self._condition:
+            return dict((host, dict(stats)) for host, stats in self._hosts.items())
+
+
+def serve(scheduler):
+    """Grant the slots of scheduler to the processes forked from this one, until stop() is called"""
+    global _address
+    directory = tempfile.mkdtemp(prefix='bandwidth-')
+    listener = Listener(os.path.join(directory, 'socket'), 'AF_UNIX',
+                        authkey=multiprocessing.current_process().authkey)
+    _address = listener.address
+
+    def accept():
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception:
+                # Closed by stop()
+                return
+            thread = threading.Thread(target=_handle, args=(scheduler, connection), name='bandwidth-client')
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=accept, name='bandwidth-scheduler')
+    thread.daemon = True
+    thread.start()
+    return listener, directory
+
+
+def stop(server):
+    global _address
+    listener, directory = server
+    _address = None
+    listener.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def _handle(scheduler, connection):
+    # One slot per client connection, given back if the client dies while holding it
+    held = None
+    try:
+        while True:
+            message = connection.recv()
+            if message[0] == 'acquire':
+                _, host, priority, connections = message
+                held = (host, connections, time.time())
+                connection.send(scheduler.acquire(priority, connections))
+            elif message[0] == 'release':
+                _, size, seconds, waited = message
+                scheduler.release(held[0], held[1], size, seconds, waited)
+                held = None
+    except (EOFError, IOError):
+        pass
+    finally:
+        if held is not None:
+            scheduler.release(held[0], held[1], 0, time.time() - held[2], 0)
+        connection.close()
+
+
+class Slot(object):
+    """Download slot granted by the scheduler; rate_kb_s is the limit of each connection, None without limit"""
+
+    def __init__(self, rate_kb_s):
+        self.rate_kb_s = rate_kb_s
+        # Bytes downloaded, set by the holder for the throughput report
+        self.size = 0
+
+
+@contextlib.contextmanager
+def slot(host, priority, connections=1):
+    """Hold a download slot of the controller's scheduler, or an unlimited one when no scheduler runs"""
+    if _address is None:
+        yield Slot(None)
+        return
+    connection = Client(_address, 'AF_UNIX', authkey=multiprocessing.current_process().authkey)
+    try:
+        requested = time.time()
+        connection.send(('acquire', host, priority, connections))
+        granted = Slot(connection.recv())
+        start = time.time()
+        try:
+            yield granted
+        finally:
+            connection.send(('release', granted.size, time.time() - start, start - requested))
+    finally:
+        connection.close()
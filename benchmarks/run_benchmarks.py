@@ -0,0 +1,172 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+"""End-to-end benchmark of an installation workflow against local stand-ins
+
+Every artefact, the apt repository and the oh-my-zsh repository are generated locally and served over HTTP, then the
+workflow is run several times with fab against a disposable target host. Wall time, remote round trips and bytes
+are reported per task, from the telemetry files of the runs.
+"""
+
+import os
+import sys
+import glob
+import json
+import shutil
+import logging
+import argparse
+import subprocess
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, REPOSITORY)
+
+import yaml
+
+import standins
+import telemetry
+
+COMMANDS = ('run', 'sudo', 'put')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('target', help='host to install, a disposable container or VM (user@host:port)')
+    parser.add_argument('--user', help='user of the target, defaults to the user of the configuration')
+    parser.add_argument('--port', type=int, default=8765, help='port of the stand-ins HTTP server')
+    parser.add_argument('--base-url', help='URL of the stand-ins as seen from the target, '
+                                           'defaults to http://<this host>:<port>')
+    parser.add_argument('--workflow', default='install_workstation')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--no-force', action='store_true',
+                        help='let tasks skip what is already installed (measures the idempotent path)')
+    parser.add_argument('--artefact-size-kb', type=int, default=1024, help='padding of each fake artefact')
+    parser.add_argument('--delay', type=float, default=0, help='latency added to every HTTP response, seconds')
+    parser.add_argument('--output', default=os.path.join(BENCHMARKS, 'results'))
+    parser.add_argument('fab_args', nargs=argparse.REMAINDER, help='extra arguments given to fab')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    output = os.path.abspath(args.output)
+    root = os.path.join(output, 'standins')
+    shutil.rmtree(output, ignore_errors=True)
+    os.makedirs(root)
+
+    base_url = args.base_url or 'http://%s:%d' % (subprocess.check_output(['hostname', '-I']).split()[0].decode(),
+                                                 args.port)
+    with open(os.path.join(REPOSITORY, 'resources', 'install_conf.yaml'), 'r') as f:
+        config = standins.rewrite_config(yaml.safe_load(f), base_url)
+    config['hosts'] = args.target
+    config['user'] = args.user or config['user']
+    config['cache'] = dict(config['cache'], directory=os.path.join(output, 'cache'))
+
+    logging.info('Generating stand-ins in %s' % root)
+    standins.build_artefacts(config, base_url, root, args.artefact_size_kb * 1024)
+    standins.build_apt_repository(os.path.join(root, 'apt'), _apt_packages(config, args.workflow))
+    standins.build_oh_my_zsh(os.path.join(root, 'oh-my-zsh.git'))
+    server = standins.serve(root, args.port, args.delay)
+
+    runs = []
+    try:
+        for index in range(args.runs):
+            runs.append(_run(config, output, index, args))
+    finally:
+        server.shutdown()
+
+    report = _report(runs)
+    with open(os.path.join(output, 'results.json'), 'w') as f:
+        json.dump({'workflow': args.workflow, 'runs': args.runs, 'artefact_size_kb': args.artefact_size_kb,
+                   'delay': args.delay, 'force': not args.no_force, 'tasks': report,
+                   'wall_time': [run['wall_time'] for run in runs]}, f, indent=2, sort_keys=True)
+    _log_report(report, runs)
+    if any(run['exit_code'] for run in runs):
+        sys.exit(1)
+
+
+def _apt_packages(config, workflow):
+    """Packages the apt tasks of the workflow install, each of them served as an empty package"""
+    config_path = os.path.join(BENCHMARKS, '.packages_conf.yaml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f, default_flow_style=False)
+    os.environ['INSTALL_CFG'] = config_path
+    cwd = os.getcwd()
+    os.chdir(REPOSITORY)
+    try:
+        import facts
+        import apt_plan
+        import fabfile
+        fabfile.env.host_string = 'benchmark'
+        fabfile._host_facts['benchmark'] = facts.HostFacts('@@codename\nxenial\n')
+        plan = apt_plan.AptPlan()
+        for task_name in fabfile.WORKFLOWS[workflow][0]:
+            fabfile.APT_PLANS[task_name](plan)
+        return plan.packages
+    finally:
+        os.chdir(cwd)
+        os.remove(config_path)
+        del os.environ['INSTALL_CFG']
+
+
+def _run(config, output, index, args):
+    directory = os.path.join(output, 'run-%d' % (index + 1))
+    config = dict(config, telemetry=dict(config['telemetry'], directory=directory))
+    config_path = os.path.join(output, 'install_conf-%d.yaml' % (index + 1))
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f, default_flow_style=False)
+
+    command = ['fab'] + ([] if args.no_force else ['--set', 'force_install=1']) + args.fab_args + \
+              ['set_host', args.workflow]
+    logging.info('Run %d/%d: %s' % (index + 1, args.runs, ' '.join(command)))
+    env = dict(os.environ, INSTALL_CFG=config_path)
+    with open(os.path.join(output, 'run-%d.log' % (index + 1)), 'w') as log:
+        exit_code = subprocess.call(command, cwd=REPOSITORY, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if exit_code:
+        logging.error('Run %d failed, see %s' % (index + 1, log.name))
+
+    events = []
+    for path in glob.glob(os.path.join(directory, '*.jsonl')):
+        events.extend(telemetry.load(path))
+    tasks = [event for event in events if event['kind'] == 'task']
+    wall_time = max(event['end'] for event in tasks) - min(event['start'] for event in tasks) if tasks else 0
+    return {'exit_code': exit_code, 'events': events, 'wall_time': wall_time}
+
+
+def _report(runs):
+    """Wall time, round trips and bytes of every task, over the runs"""
+    samples = {}
+    for run in runs:
+        per_task = {}
+        for event in run['events']:
+            if event['kind'] == 'task':
+                task = per_task.setdefault(event['name'], {'wall_time': 0, 'round_trips': 0, 'bytes': 0})
+                task['wall_time'] += event['end'] - event['start']
+        for event in run['events']:
+            if event['kind'] in COMMANDS and event['task'] in per_task:
+                per_task[event['task']]['round_trips'] += 1
+                per_task[event['task']]['bytes'] += event['bytes']
+        for name, task in per_task.items():
+            for key, value in task.items():
+                samples.setdefault(name, {}).setdefault(key, []).append(value)
+
+    return dict((name, dict((key, _statistics(values)) for key, values in metrics.items()))
+                for name, metrics in samples.items())
+
+
+def _statistics(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    median = values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+    return {'median': median, 'min': values[0], 'max': values[-1]}
+
+
+def _log_report(report, runs):
+    logging.info('%-32s %10s %10s %10s %8s %12s' % ('task', 'median s', 'min s', 'max s', 'trips', 'bytes'))
+    for name, metrics in sorted(report.items(), key=lambda item: item[1]['wall_time']['median'], reverse=True):
+        logging.info('%-32s %10.2f %10.2f %10.2f %8d %12d' % (
+            name, metrics['wall_time']['median'], metrics['wall_time']['min'], metrics['wall_time']['max'],
+            metrics['round_trips']['median'], metrics['bytes']['median']))
+    logging.info('Workflow wall time: %s' % ', '.join('%.1fs' % run['wall_time'] for run in runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+"""Local stand-ins for everything the installer downloads: artefacts, apt repository and oh-my-zsh git repository"""
+
+import os
+import io
+import re
+import gzip
+import time
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import logging
+import threading
+import subprocess
+
+try:
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from SocketServer import ThreadingTCPServer
+except ImportError:
+    from http.server import SimpleHTTPRequestHandler
+    from socketserver import ThreadingTCPServer
+
+import artefacts
+
+
+def rewrite_config(properties, base_url):
+    """Copy of the configuration whose URLs, repositories included, all point to base_url"""
+    config = dict((key, dict(value) if isinstance(value, dict) else value) for key, value in properties.items())
+    for section in config.values():
+        if not isinstance(section, dict):
+            continue
+        for key, value in section.items():
+            if (key == 'url' or key.endswith('.url')) and isinstance(value, str):
+                section[key] = re.sub(r'^https?://', base_url.rstrip('/') + '/', value)
+        for key in [key for key in section if key == 'sha256' or key.endswith('.sha256')]:
+            section[key] = None
+    config['mirrors']['groups'] = {}
+    config['oh-my-zsh']['repository'] = base_url.rstrip('/') + '/oh-my-zsh.git'
+    config['apt']['repository'] = base_url.rstrip('/') + '/apt'
+    config['proxy'] = {'host': None, 'port': None, 'username': None, 'pwd': None}
+    return config
+
+
+def build_artefacts(config, base_url, root, size):
+    """Generate a fake artefact, with the expected layout, at the path of every configured URL"""
+    for artefact in artefacts.resolve(config).values():
+        path = os.path.join(root, artefact.url[len(base_url.rstrip('/')) + 1:])
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        _ARTEFACT_BUILDERS.get(artefact.name, _jar)(path, config, size)
+
+
+def build_apt_repository(directory, packages):
+    """Flat apt repository with an empty package for each name"""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    stanzas = []
+    for package in packages:
+        filename = '%s_1.0_all.deb' % package
+        _deb(os.path.join(directory, filename), package, '1.0', {})
+        with open(os.path.join(directory, filename), 'rb') as f:
+            content = f.read()
+        stanzas.append('\n'.join([
+            'Package: %s' % package,
+            'Version: 1.0',
+            'Architecture: all',
+            'Maintainer: benchmark <benchmark@localhost>',
+            'Filename: ./%s' % filename,
+            'Size: %d' % len(content),
+            'SHA256: %s' % hashlib.sha256(content).hexdigest(),
+            'Description: benchmark stand-in for %s' % package,
+        ]))
+    index = ('\n\n'.join(stanzas) + '\n').encode('utf-8')
+    with open(os.path.join(directory, 'Packages'), 'wb') as f:
+        f.write(index)
+    with gzip.open(os.path.join(directory, 'Packages.gz'), 'wb') as f:
+        f.write(index)
+
+    release = ['Origin: dev-workstation-installer benchmark', 'Date: %s' % time.strftime(
+        '%a, %d %b %Y %H:%M:%S UTC', time.gmtime()), 'SHA256:']
+    for name in ('Packages', 'Packages.gz'):
+        with open(os.path.join(directory, name), 'rb') as f:
+            content = f.read()
+        release.append(' %s %d %s' % (hashlib.sha256(content).hexdigest(), len(content), name))
+    with open(os.path.join(directory, 'Release'), 'w') as f:
+        f.write('\n'.join(release) + '\n')
+
+
+def build_oh_my_zsh(directory):
+    """Bare git repository served over dumb HTTP, standing in for oh-my-zsh"""
+    work = directory + '.work'
+    shutil.rmtree(work, ignore_errors=True)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(os.path.join(work, 'templates'))
+    with open(os.path.join(work, 'oh-my-zsh.sh'), 'w') as f:
+        f.write('# benchmark stand-in\n')
+    with open(os.path.join(work, 'templates', 'zshrc.zsh-template'), 'w') as f:
+        f.write('export ZSH=$HOME/.oh-my-zsh\nplugins=(git)\nsource $ZSH/oh-my-zsh.sh\n')
+    git = ['git', '-c', 'user.name=benchmark', '-c', 'user.email=benchmark@localhost']
+    subprocess.check_call(git + ['init', '-q', work])
+    subprocess.check_call(git + ['symbolic-ref', 'HEAD', 'refs/heads/master'], cwd=work)
+    subprocess.check_call(git + ['add', '.'], cwd=work)
+    subprocess.check_call(git + ['commit', '-q', '-m', 'stand-in'], cwd=work)
+    subprocess.check_call(['git', 'clone', '-q', '--bare', work, directory])
+    subprocess.check_call(['git', 'update-server-info'], cwd=directory)
+    shutil.rmtree(work)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    """Static files of root, with single byte ranges like the real mirrors"""
+    root = None
+    delay = 0
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def translate_path(self, path):
+        # Resolved against root instead of the working directory of the process
+        path = SimpleHTTPRequestHandler.translate_path(self, path)
+        return os.path.join(self.root, os.path.relpath(path, os.getcwd()))
+
+    def send_head(self):
+        if self.delay:
+            time.sleep(self.delay)
+        self._remaining = None
+        path = self.translate_path(self.path)
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+        if match is None or not os.path.isfile(path):
+            return SimpleHTTPRequestHandler.send_head(self)
+
+        size = os.path.getsize(path)
+        first = int(match.group(1))
+        last = min(int(match.group(2) or size - 1), size - 1)
+        if first > last:
+            self.send_error(416)
+            return None
+        f = open(path, 'rb')
+        f.seek(first)
+        self._remaining = last - first + 1
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (first, last, size))
+        self.send_header('Content-Length', str(self._remaining))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        return f
+
+    def end_headers(self):
+        if self._remaining is None:
+            self.send_header('Accept-Ranges', 'bytes')
+        SimpleHTTPRequestHandler.end_headers(self)
+
+    def copyfile(self, source, outputfile):
+        if self._remaining is None:
+            return SimpleHTTPRequestHandler.copyfile(self, source, outputfile)
+        while self._remaining > 0:
+            chunk = source.read(min(self._remaining, 64 * 1024))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            self._remaining -= len(chunk)
+
+
+def serve(root, port, delay=0):
+    """Serve root over HTTP from a background thread, optionally delaying every response"""
+    served, delayed = os.path.abspath(root), delay
+
+    # A class statement, SimpleHTTPRequestHandler being an old-style class which type() cannot subclass
+    class Handler(_QuietHandler):
+        root = served
+        delay = delayed
+
+    ThreadingTCPServer.allow_reuse_address = True
+    server = ThreadingTCPServer(('', port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _padding(size):
+    # Random content, so that compression does not shrink the stand-ins below the requested size
+    return os.urandom(size)
+
+
+def _tarball(top, files):
+    def build(path, config, size):
+        with tarfile.open(path, 'w:gz') as tar:
+            members = dict(files(config))
+            members['%s/lib/padding.bin'] = _padding(size)
+            for name, content in members.items():
+                _add(tar, name % top(config), content)
+    return build
+
+
+def _add(tar, name, content, mode=0o755):
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mode = mode
+    info.mtime = time.time()
+    tar.addfile(info, io.BytesIO(content))
+
+
+def _jar(path, config, size):
+    with open(path, 'wb') as f:
+        _jar_to(f, size)
+
+
+def _fake_smtp(path, config, size):
+    with zipfile.ZipFile(path, 'w') as archive:
+        jar = io.BytesIO()
+        _jar_to(jar, size)
+        archive.writestr('fakeSMTP-%s.jar' % config['fakeSMTP']['version'], jar.getvalue())
+
+
+def _jar_to(f, size):
+    with zipfile.ZipFile(f, 'w') as jar:
+        jar.writestr('META-INF/MANIFEST.MF', 'Manifest-Version: 1.0\n')
+        jar.writestr('padding.bin', _padding(size))
+
+
+def _liquibase(path, config, size):
+    version = str(config['liquibase']['version'])
+    _deb(path, 'liquibase', version, {
+        'usr/lib/liquibase-%s/lib/padding.bin' % version: _padding(size),
+        'usr/bin/liquibase': ('#!/bin/sh\necho "Liquibase Version: %s"\n' % version).encode('utf-8'),
+    })
+
+
+def _schemacrawler(path, config, size):
+    version = str(config['schemacrawler']['version'])
+    _deb(path, 'schemacrawler', version, {
+        'opt/schemacrawler/lib/padding.bin': _padding(size),
+        'opt/schemacrawler/additional-lints/schemacrawler-additional-lints-%s.jar' % version: b'',
+        'usr/bin/schemacrawler': ('#!/bin/sh\necho "SchemaCrawler %s"\n' % version).encode('utf-8'),
+    })
+
+
+def _deb(path, package, version, files):
+    """Minimal Debian package: an ar archive of debian-binary, control.tar.gz and data.tar.gz"""
+    control = '\n'.join(['Package: %s' % package, 'Version: %s' % version, 'Architecture: all',
+                         'Maintainer: benchmark <benchmark@localhost>',
+                         'Description: benchmark stand-in for %s' % package, ''])
+    members = [('debian-binary', b'2.0\n'),
+               ('control.tar.gz', _tar_gz({'./control': control.encode('utf-8')})),
+               ('data.tar.gz', _tar_gz(dict(('./' + name, content) for name, content in files.items())))]
+    with open(path, 'wb') as f:
+        f.write(b'!<arch>\n')
+        for name, content in members:
+            header = '%-16s%-12d%-6d%-6d%-8s%-10d`\n' % (name, int(time.time()), 0, 0, '100644', len(content))
+            f.write(header.encode('ascii'))
+            f.write(content)
+            if len(content) % 2:
+                f.write(b'\n')
+
+
+def _tar_gz(files):
+    content = io.BytesIO()
+    with tarfile.open(fileobj=content, mode='w:gz') as tar:
+        for name, data in sorted(files.items()):
+            _add(tar, name, data)
+    return content.getvalue()
+
+
+_ARTEFACT_BUILDERS = {
+    'maven': _tarball(lambda config: 'apache-maven-%s' % config['maven']['version'],
+                      lambda config: [('%s/bin/mvn', b'#!/bin/sh\n')]),
+    'ant': _tarball(lambda config: 'apache-ant-%s' % config['ant']['version'],
+                    lambda config: [('%s/bin/ant', b'#!/bin/sh\n')]),
+    'intellij': _tarball(lambda config: config['intellij']['build'],
+                         lambda config: [('%s/bin/idea.sh', b'#!/bin/sh\n'),
+                                         ('%s/bin/idea64.vmoptions', b'-Xms128m\n-Xmx750m\n')]),
+    'datagrip': _tarball(lambda config: 'DataGrip-%s' % config['datagrip']['version'],
+                         lambda config: [('%s/bin/datagrip.sh', b'#!/bin/sh\n')]),
+    'ads': _tarball(lambda config: 'ApacheDirectoryStudio',
+                    lambda config: [('%s/ApacheDirectoryStudio', b'#!/bin/sh\n')]),
+    'tomcat': _tarball(lambda config: 'apache-tomcat-%s' % config['tomcat']['version'],
+                       lambda config: [('%s/bin/catalina.sh', b'#!/bin/sh\n')]),
+    'fakeSMTP': _fake_smtp,
+    'liquibase': _liquibase,
+    'schemacrawler': _schemacrawler,
+}
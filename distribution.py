@@ -0,0 +1,48 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+# Directory of the working directory receiving files, moved into place once complete
+INCOMING = '.incoming'
+
+
+def next_round(holders, pending, fanout):
+    """Transfers of the next round, as (sender, receivers) pairs; the controller is the sender None
+
+    Every sender, the controller and each host which already holds the files, sends to at most fanout hosts,
+    so that the number of holders is multiplied by fanout + 1 at each round.
+    """
+    transfers = []
+    pending = list(pending)
+    for sender in [None] + list(holders):
+        if not pending:
+            break
+        receivers, pending = pending[:fanout], pending[fanout:]
+        transfers.append((sender, receivers))
+    return transfers
+
+
+def forward_command(directory, filenames, receivers, accept_unknown_host_keys=False):
+    """Command run on a holder, copying the files to every receiver concurrently and printing those which succeeded
+
+    receivers are (host string, user, host, port) tuples. Files are copied into the incoming directory of the
+    receiver first, so that an interrupted copy is never mistaken for a complete file. The host keys of the receivers
+    are checked against the known hosts of the holder, unless accept_unknown_host_keys is set.
+    """
+    incoming = '%s/%s' % (directory, INCOMING)
+    options = '-o BatchMode=yes'
+    if accept_unknown_host_keys:
+        options += ' -o StrictHostKeyChecking=no'
+    copies = []
+    for host_string, user, host, port in receivers:
+        ssh = 'ssh -p %s %s %s@%s' % (port, options, user, host)
+        copies.append(
+            '{ %s "mkdir -p %s" && scp -q -P %s %s %s %s@%s:%s/ && '
+            '%s "cd %s && mv %s %s/" && echo "@@received %s"; } &' % (
+                ssh, incoming, port, options, ' '.join(filenames), user, host, incoming,
+                ssh, incoming, ' '.join(filenames), directory, host_string))
+    return 'cd %s && %s wait' % (directory, ' '.join(copies))
+
+
+def received(output):
+    """Host strings which forward_command reports as having received the files"""
+    return [line.split(None, 1)[1].strip() for line in output.splitlines() if line.startswith('@@received ')]
@@ -0,0 +1,132 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import logging
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urllib2 import build_opener, ProxyHandler, Request
+except ImportError:
+    from urllib.request import build_opener, ProxyHandler, Request
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 30
+
+
+class SegmentError(Exception):
+    pass
+
+
+class _HeadRequest(Request):
+    def get_method(self):
+        return 'HEAD'
+
+
+def head(url, proxies=None, timeout=TIMEOUT):
+    """Size of url and whether its server accepts range requests, (None, False) when it cannot tell"""
+    try:
+        response = build_opener(ProxyHandler(proxies or {})).open(_HeadRequest(url), timeout=timeout)
+    except Exception as e:
+        logging.debug('HEAD %s failed: %s' % (url, e))
+        return None, False
+    try:
+        info = response.info()
+        length = info.get('Content-Length')
+        return (int(length) if length is not None else None), info.get('Accept-Ranges') == 'bytes'
+    finally:
+        response.close()
+
+
+def ranges(size, segments):
+    """(first, last) byte of each segment of a file of the given size"""
+    length = -(-size // segments)
+    return [(start, min(start + length, size) - 1) for start in range(0, size, length)]
+
+
+def throttle(start, transferred, rate):
+    """Wait while the bytes transferred since start are ahead of rate bytes per second, None for no limit"""
+    if rate:
+        ahead = transferred / float(rate) - (time.time() - start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def download(url, path, size, segments, proxies=None, rate=None):
+    """Download url into path in parallel ranges, resuming the parts an interrupted download left next to path
+
+    rate limits each range in bytes per second.
+    """
+    parts = ['%s.%d' % (path, index) for index in range(len(ranges(size, segments)))]
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    pool = ThreadPool(len(parts))
+    try:
+        pool.map(lambda args: _download_range(url, proxies, rate, *args), zip(parts, ranges(size, segments)))
+    finally:
+        pool.close()
+
+    with open(path, 'wb') as f:
+        for part in parts:
+            with open(part, 'rb') as part_file:
+                shutil.copyfileobj(part_file, f, CHUNK_SIZE)
+    for part in parts:
+        os.remove(part)
+
+
+def _download_range(url, proxies, rate, part, byte_range):
+    first, last = byte_range
+    have = os.path.getsize(part) if os.path.exists(part) else 0
+    if have > last - first + 1:
+        os.remove(part)
+        have = 0
+    if have == last - first + 1:
+        return
+
+    request = Request(url, headers={'Range': 'bytes=%d-%d' % (first + have, last)})
+    response = build_opener(ProxyHandler(proxies or {})).open(request, timeout=TIMEOUT)
+    try:
+        if response.getcode() != 206:
+            raise SegmentError('%s: range %d-%d not served (HTTP %d)' % (url, first + have, last, response.getcode()))
+        with open(part, 'ab') as f:
+            start = time.time()
+            transferred = 0
+            chunk = response.read(CHUNK_SIZE)
+            while chunk:
+                f.write(chunk)
+                transferred += len(chunk)
+                throttle(start, transferred, rate)
+                chunk = response.read(CHUNK_SIZE)
+    finally:
+        response.close()
+
+    if os.path.getsize(part) != last - first + 1:
+        raise SegmentError('%s: range %d-%d interrupted' % (url, first, last))
+
+
+def shell_command(url, target, size, segments, wget='wget', sha256=None):
+    """Shell command downloading url into target with one wget per range, resuming the parts of a previous attempt
+
+    The parts are kept when a range fails, so that running the command again downloads only what is missing.
+    """
+    steps = []
+    parts = []
+    for index, (first, last) in enumerate(ranges(size, segments)):
+        part = '%s.part%d' % (target, index)
+        parts.append(part)
+        # wget only takes the start of a range, head stops the transfer at its end
+        steps.append('{ have=$(stat -c %%s %s 2>/dev/null || echo 0); [ $have -ge %d ] || '
+                     '%s -q --start-pos=$((%d + have)) -O - %s | head -c $((%d - have)) >> %s; } &'
+                     % (part, last - first + 1, wget, first, url, last - first + 1, part))
+    steps.append('wait')
+
+    # Missing bytes leave the parts for the next attempt, a corrupted file removes them
+    assemble = ['cat %s > %s.partial' % (' '.join(parts), target)]
+    if sha256 is not None:
+        assemble.append('test "$(sha256sum < %s.partial | cut -d" " -f1)" = "%s"' % (target, sha256))
+    assemble.extend(['mv %s.partial %s' % (target, target), 'rm -f %s' % ' '.join(parts)])
+    return '%s; test "$(cat %s | wc -c)" -eq %d && { %s || { rm -f %s %s.partial; false; }; }' % (
+        ' '.join(steps), ' '.join(parts), size, ' && '.join(assemble), ' '.join(parts), target)
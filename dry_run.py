@@ -0,0 +1,189 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import posixpath
+import logging
+import functools
+
+from fabric.state import env
+
+import telemetry
+import downloads
+
+# URLs fetched on the host by the recorded commands
+_DOWNLOADED_URL = re.compile(r'''(https?://[^\s'"|;&,]+)''')
+HEAD_TIMEOUT = 5
+
+# Plan of the current run, None when commands are really executed, see start()
+_plan = None
+
+
+class Plan(object):
+    """Commands, downloads and file edits a run would perform, in order"""
+
+    def __init__(self, proxies=None):
+        self.entries = []
+        self.proxies = proxies
+        self._sizes = {}
+        self._remote_paths = set()
+
+    def add(self, kind, command, size=None, url=None, where='host'):
+        entry = {
+            'kind': kind,
+            'host': env.host_string,
+            'task': telemetry.current_task(),
+            'cwd': env.cwd or None,
+            'command': command,
+            'url': url,
+            'where': where,
+            'bytes': size,
+        }
+        self.entries.append(entry)
+        return entry
+
+    def size(self, url):
+        """Size of url from a HEAD request, None when the server does not tell or cannot be reached"""
+        if url not in self._sizes:
+            self._sizes[url] = None
+            self._sizes[url] = downloads.head(url, self.proxies, HEAD_TIMEOUT)[0]
+        return self._sizes[url]
+
+    def exists(self, path):
+        return path in self._remote_paths
+
+    def on_host(self, url):
+        """Whether a file named after url has already been put on the host"""
+        return any(posixpath.basename(path) == posixpath.basename(url) for path in self._remote_paths)
+
+    def installed_packages(self):
+        """Packages the recorded apt-get commands install"""
+        packages = []
+        for entry in self.entries:
+            if entry['kind'] == 'sudo' and entry['command'].startswith('apt-get -y install '):
+                packages.extend(entry['command'].split()[3:])
+        return packages
+
+    def estimate(self, command_overhead, bandwidth):
+        """Estimated duration of each entry: a round trip per command plus the transfer of its bytes"""
+        for entry in self.entries:
+            overhead = command_overhead if entry['kind'] in ('run', 'sudo', 'put', 'edit') else 0
+            transfer = (entry['bytes'] or 0) / float(bandwidth) if entry['kind'] in ('download', 'put') else 0
+            entry['estimate'] = overhead + transfer
+
+    def duplicates(self):
+        """Commands issued more than once for the same host, in the same directory"""
+        seen = {}
+        for entry in self.entries:
+            if entry['kind'] in ('run', 'sudo'):
+                key = (entry['host'], entry['cwd'], entry['command'])
+                seen[key] = seen.get(key, 0) + 1
+        return [(command, count) for command, count in seen.items() if count > 1]
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+
+
+class _Result(str):
+    """Output of a recorded command, which always succeeds"""
+    return_code = 0
+    failed = False
+    succeeded = True
+    stderr = ''
+
+
+class _PutResult(list):
+    failed = []
+    succeeded = True
+
+
+def start(proxies=None):
+    """Record the commands of this process instead of executing them"""
+    global _plan
+    _plan = Plan(proxies)
+    return _plan
+
+
+def active():
+    return _plan is not None
+
+
+def installed_packages():
+    return _plan.installed_packages()
+
+
+def recording(operation, kind):
+    """Wrap a Fabric operation (run, sudo, put) so that it is only recorded while a plan is active"""
+    @functools.wraps(operation)
+    def wrapper(*args, **kwargs):
+        if _plan is None:
+            return operation(*args, **kwargs)
+        if kind == 'put':
+            return _record_put(*args, **kwargs)
+        command = kwargs.get('command', args[0] if args else '')
+        _plan.add(kind, command)
+        if 'wget' in command:
+            # Other URLs with the same file name are mirrors, tried only when the first one fails
+            names = set()
+            for url in _DOWNLOADED_URL.findall(command):
+                if _plan.on_host(url) or posixpath.basename(url) in names:
+                    continue
+                names.add(posixpath.basename(url))
+                _plan.add('download', 'wget ' + url, _plan.size(url), url)
+        return _Result('')
+    return wrapper
+
+
+def recording_exists(exists):
+    """Wrap fabric.contrib.files.exists, answering from the files put earlier in the plan"""
+    @functools.wraps(exists)
+    def wrapper(path, *args, **kwargs):
+        if _plan is None:
+            return exists(path, *args, **kwargs)
+        return _plan.exists(path)
+    return wrapper
+
+
+def controller_download(url, cached_path):
+    """Record the download of url into the controller cache, and return the path it would have"""
+    if cached_path is not None:
+        _plan.add('cached', 'cache hit ' + url, os.path.getsize(cached_path), url, 'controller')
+        return cached_path
+    size = _plan.size(url)
+    _plan.add('download', 'fetch ' + url, size, url, 'controller')
+    return url
+
+
+def _record_put(local_path=None, remote_path=None, *args, **kwargs):
+    if hasattr(local_path, 'getvalue'):
+        _plan.add('edit', 'write %s' % remote_path, len(local_path.getvalue()))
+    elif local_path in _plan._sizes:
+        _plan.add('put', 'put %s %s' % (local_path, remote_path), _plan._sizes[local_path], local_path)
+    else:
+        size = os.path.getsize(local_path) if local_path and os.path.isfile(local_path) else None
+        _plan.add('put', 'put %s %s' % (local_path, remote_path), size)
+    if remote_path is not None:
+        _plan._remote_paths.add(remote_path if remote_path.startswith('/') or env.cwd is None
+                                else '%s/%s' % (env.cwd, remote_path))
+    return _PutResult([remote_path])
+
+
+def log_plan(plan):
+    for entry in plan.entries:
+        size = '' if entry['bytes'] is None else ' (%d bytes)' % entry['bytes']
+        cwd = '%s$ ' % entry['cwd'] if entry['cwd'] and entry['kind'] in ('run', 'sudo') else ''
+        logging.info('  %-28s %-6s %s%s%s' % (entry['task'], entry['kind'], cwd, entry['command'], size))
+
+    commands = [entry for entry in plan.entries if entry['kind'] in ('run', 'sudo', 'put', 'edit')]
+    downloads = [entry for entry in plan.entries if entry['kind'] == 'download']
+    unknown = [entry['url'] for entry in downloads if entry['bytes'] is None]
+    logging.info('%d remote commands, %d downloads (%d bytes%s), %d bytes uploaded, %.0fs if run one after another' % (
+        len(commands), len(downloads), sum(entry['bytes'] or 0 for entry in downloads),
+        ', %d of unknown size' % len(unknown) if unknown else '',
+        sum(entry['bytes'] or 0 for entry in plan.entries if entry['kind'] in ('put', 'edit')),
+        sum(entry['estimate'] for entry in plan.entries)))
+    for (host, cwd, command), count in plan.duplicates():
+        logging.warning('Run %d times on %s: %s' % (count, host, command))
@@ -3,21 +3,100 @@
 
 from __future__ import with_statement
 
-import yaml
+import os
+import atexit
+import sys
+import time
+import hashlib
+import functools
 from fabric.api import *
 from fabric.context_managers import cd
 from fabric.operations import run, sudo
 from fabric.contrib import files
+from fabric import state
+from fabric.network import normalize
+import posixpath
+import tarfile
+import shutil
+from multiprocessing.pool import ThreadPool
+from StringIO import StringIO
+from xml.sax.saxutils import escape
 import setup_logging
 import logging
-
-setup_logging.setup_logging()
-
-with open("resources/install_conf.yaml", 'r') as ymlfile:
-    properties = yaml.load(ymlfile)
+import artefacts
+import apt_plan
+import artefact_cache
+import scheduler
+import probes
+import archives
+import mirrors
+import downloads
+import distribution
+import facts
+import telemetry
+import dry_run
+import remote_shell
+import task_output
+import manifest
+import bandwidth
+import journal
+import jvm_sizing
+import pg_tuning
+
+# Every remote command is timed and recorded, or only recorded by the plan task
+run = dry_run.recording(telemetry.instrument(
+    task_output.capturing(remote_shell.persistent(run, False), 'run'), 'run'), 'run')
+sudo = dry_run.recording(telemetry.instrument(
+    task_output.capturing(remote_shell.persistent(sudo, True), 'sudo'), 'sudo'), 'sudo')
+put = dry_run.recording(telemetry.instrument(put, 'put'), 'put')
+exists = dry_run.recording_exists(files.exists)
+
+# Set up by the first task run, so that fab -l neither reads the logging configuration nor opens its files
+_logging_configured = False
+
+
+def timed_task(func):
+    """Record the duration of a task, the logging being set up first"""
+    timed = telemetry.timed_task(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _logging_configured
+        if not _logging_configured:
+            setup_logging.setup_logging()
+            _logging_configured = True
+        return timed(*args, **kwargs)
+    return wrapper
+
+
+def _configure(properties):
+    telemetry.configure(properties['telemetry']['directory'])
+    remote_shell.configure(properties['remote_shell']['enabled'])
+    task_output.configure(properties['output']['directory'], properties['output']['verbose'])
+
+
+# Loaded by the first task reading it, from the compiled manifest while the file is unchanged: fab -l does not
+properties = manifest.Manifest(os.getenv('INSTALL_CFG', "resources/install_conf.yaml"), _configure)
+
+
+def _telemetry_report():
+    events_path = telemetry.events_path()
+    if events_path is None or not os.path.exists(events_path):
+        return
+    events = telemetry.load(events_path)
+    trace_path = events_path.replace('.jsonl', '.trace.json')
+    telemetry.write_chrome_trace(events, trace_path)
+    telemetry.log_summary(events, properties['telemetry']['slowest'])
+    logging.info('Timings recorded in %s and %s' % (events_path, trace_path))
+    if task_output.directory() is not None and os.path.isdir(task_output.directory()):
+        logging.info('Output of the remote commands in %s' % task_output.directory())
+
+
+atexit.register(_telemetry_report)
 
 
 @task
+@timed_task
 def set_host():
     env.hosts = properties['hosts']
     env.user = properties['user']
@@ -25,343 +104,928 @@ def set_host():
 
 
 @task
+@timed_task
 def my_install_workstation():
-    set_host()
-    mkdir_working_directory()
+    _run_workflow('my_install_workstation')
 
-    java_install()
-    liquibase_install()
-    schemacrawler_install()
-    intellij_install()
-    datagrip_install()
 
-    maven_install()
-    ant_install()
-    git_install()
-    apache_directory_studio_install()
-    apache_tomcat_install()
-    postgresql_install()
+@task
+@timed_task
+def install_workstation():
+    _run_workflow('install_workstation')
+
+
+# Apt-based tasks installed in a single transaction, then steps run by the scheduler
+WORKFLOWS = {
+    'my_install_workstation': (
+        ['java_install', 'git_install', 'postgresql_install', 'tools_install', 'spotify_install',
+         'sublime_text_install', 'atom_install', 'oh_my_zsh_install'],
+        ['liquibase_install', 'schemacrawler_install', 'intellij_install', 'datagrip_install',
+         'maven_install', 'ant_install', 'apache_directory_studio_install', 'apache_tomcat_install',
+         'postgresql_configure', 'bfg_repo_cleaner_install', 'fakeSMTP_install',
+         'oh_my_zsh_install', 'edit_oh_my_zshrc']),
+    'install_workstation': (
+        ['java_install', 'git_install', 'tools_install', 'sublime_text_install', 'atom_install',
+         'oh_my_zsh_install'],
+        ['liquibase_install', 'schemacrawler_install', 'maven_install',
+         'apache_directory_studio_install', 'apache_tomcat_install', 'bfg_repo_cleaner_install',
+         'fakeSMTP_install', 'oh_my_zsh_install', 'edit_oh_my_zshrc']),
+}
+
+
+# Ordering constraints and shared resources of the workflow steps
+TASK_GRAPH = {
+    'prefetch_artefacts': {'locks': ['network']},
+    'apt_install': {'locks': ['dpkg', 'network']},
+    'liquibase_install': {'after': ['apt_install', 'prefetch_artefacts'], 'locks': ['dpkg']},
+    'schemacrawler_install': {'after': ['apt_install', 'prefetch_artefacts'], 'locks': ['dpkg']},
+    'intellij_install': {'after': ['prefetch_artefacts'], 'locks': ['working_directory']},
+    'datagrip_install': {'after': ['prefetch_artefacts'], 'locks': ['working_directory']},
+    'maven_install': {'after': ['prefetch_artefacts'], 'locks': ['working_directory']},
+    'ant_install': {'after': ['prefetch_artefacts'], 'locks': ['working_directory']},
+    'apache_directory_studio_install': {'after': ['prefetch_artefacts'], 'locks': ['working_directory']},
+    'apache_tomcat_install': {'after': ['prefetch_artefacts'], 'locks': ['working_directory']},
+    'postgresql_configure': {'after': ['apt_install']},
+    'bfg_repo_cleaner_install': {'after': ['prefetch_artefacts'], 'locks': ['working_directory']},
+    'fakeSMTP_install': {'after': ['apt_install', 'prefetch_artefacts'], 'locks': ['working_directory']},
+    'oh_my_zsh_install': {'after': ['apt_install'], 'locks': ['network']},
+    'edit_oh_my_zshrc': {'after': ['oh_my_zsh_install']},
+}
+
+# Priority of the downloads of each step in a fleet run, the steps most others wait for first
+DOWNLOAD_PRIORITIES = bandwidth.priorities(TASK_GRAPH)
+
+
+def _run_workflow(workflow):
+    results = _workflow_results(workflow)
+    failed = [result.name for result in results if result.status != 'success']
+    if failed:
+        abort('Workflow steps not completed: %s' % ', '.join(failed))
+
+
+def _workflow_results(workflow):
+    require('hosts', provided_by=[set_host])
+
+    gather_facts()
+    mkdir_working_directory()
+    probe_mirrors()
+
+    # Steps completed on this host by an earlier run, with the same configuration, are skipped when resuming;
+    # prefetching is not, the artefacts of the remaining steps may be missing
+    host_journal = journal.Journal(os.path.join(properties['journal']['directory'], '%s.jsonl' % env.host))
+    completed = []
+    if _flag('resume'):
+        completed = [name for name, _ in _workflow_nodes(workflow) if name != 'prefetch_artefacts' and
+                     host_journal.completed(name, journal.config_hash(properties, name))]
+        if completed:
+            logging.info('Resuming %s, steps already completed: %s' % (workflow, ', '.join(completed)))
+
+    # Steps run in child processes, each one opening its own SSH connection
+    env.linewise = True
+    results = scheduler.run(_workflow_nodes(workflow, completed), TASK_GRAPH, properties['scheduler']['locks'],
+                            properties['scheduler']['workers'], child_init=state.connections.clear)
+    for result in results:
+        if result.status == 'success':
+            host_journal.record(result.name, journal.config_hash(properties, result.name))
+    _remove_prefetched_jars()
+    scheduler.log_summary(results, TASK_GRAPH)
+    return results
+
+
+def _remove_prefetched_jars():
+    """Remove the jars prefetched into the working directory which are in the jar store
+
+    Done once every step is over, the installers sharing a jar copying it from the working directory concurrently.
+    """
+    resolved = _artefacts()
+    removals = ["{ test ! -e %s || rm -f %s/%s; }" % (resolved[name].install_path, properties['working_directory'],
+                                                     resolved[name].filename)
+                for name in artefacts.JARS if name in resolved]
+    if removals:
+        with settings(warn_only=True):
+            run(" && ".join(removals))
+
+
+def _workflow_nodes(workflow, completed=()):
+    apt_tasks, steps = WORKFLOWS[workflow]
+    steps = [step for step in steps if step not in completed]
+    nodes = []
+    if steps:
+        nodes.append(('prefetch_artefacts', lambda: prefetch_artefacts(*steps)))
+    if 'apt_install' not in completed:
+        nodes.append(('apt_install', lambda: apt_install(*apt_tasks)))
+    nodes.extend((step, globals()[step]) for step in steps)
+    return nodes
 
-    tools_install()
-    bfg_repo_cleaner_install()
-    fakeSMTP_install()
-    spotify_install()
-    sublime_text_install()
-    atom_install()
 
-    oh_my_zsh_install()
-    edit_oh_my_zshrc()
+@task
+@timed_task
+def plan(workflow='install_workstation', live_facts=False, codename='xenial', output=None):
+    # Facts are either gathered from the host, the only remote command, or those of a fresh install
+    with settings(host_string=env.host_string or 'localhost', hosts=env.hosts or ['localhost']):
+        if _true(live_facts):
+            gather_facts()
+        else:
+            _host_facts[env.host_string] = facts.HostFacts('@@codename\n%s\n@@home\n/home/%s\n' % (
+                codename, properties['user']))
+
+        recorded = dry_run.start(_proxies())
+        mkdir_working_directory()
+        results = []
+        for name, node in _workflow_nodes(workflow):
+            first = len(recorded.entries)
+            node()
+            results.append((name, recorded.entries[first:]))
+
+        recorded.estimate(properties['plan']['command_overhead_s'], properties['plan']['bandwidth_kb_s'] * 1024)
+        dry_run.log_plan(recorded)
+
+        # Steps start as soon as their dependencies are done, locks aside
+        ends = {}
+        steps = []
+        for name, entries in results:
+            start = max([ends[dep] for dep in TASK_GRAPH.get(name, {}).get('after', []) if dep in ends] or [0])
+            ends[name] = start + sum(entry['estimate'] for entry in entries)
+            steps.append(scheduler.TaskResult(name, 'planned', start, ends[name]))
+        scheduler.log_summary(steps, TASK_GRAPH)
+
+        if output:
+            recorded.write(output)
+            logging.info('Plan written to %s' % output)
 
 
 @task
-def install_workstation():
+@runs_once
+@timed_task
+def fleet(workflow='install_workstation', pool_size=None):
     set_host()
-    mkdir_working_directory()
+    pool_size = int(pool_size or properties['fleet']['pool_size'])
+    logging.info('Run %s on %d hosts, %d at a time...' % (workflow, len(env.hosts), pool_size))
+
+    # Downloads of every host wait for a slot of the controller, within the connections and bandwidth of the proxy
+    slots = None
+    if properties['bandwidth']['enabled']:
+        slots = bandwidth.Scheduler(properties['bandwidth']['max_connections'], properties['bandwidth']['budget_kb_s'])
+        server = bandwidth.serve(slots)
+    try:
+        if properties['distribution']['enabled'] and properties['cache']['enabled'] and len(env.hosts) > 1:
+            distribute_artefacts(workflow, pool_size)
+
+        results = execute(parallel(pool_size=pool_size)(_fleet_host), workflow, hosts=env.hosts)
+    finally:
+        if slots is not None:
+            bandwidth.stop(server)
+    reports = dict((host, _fleet_report(result)) for host, result in results.items())
+    _log_fleet_summary(reports)
+    if slots is not None:
+        _log_bandwidth_summary(slots.throughput())
+
+    failed_hosts = [host for host, report in reports.items() if report['status'] != 'success']
+    if failed_hosts:
+        abort('%s failed on: %s' % (workflow, ', '.join(failed_hosts)))
 
-    java_install()
-    liquibase_install()
-    schemacrawler_install()
 
-    maven_install()
-    git_install()
-    apache_directory_studio_install()
-    apache_tomcat_install()
+@task
+@runs_once
+@timed_task
+def distribute_artefacts(workflow='install_workstation', pool_size=None):
+    require('hosts', provided_by=[set_host])
+    pool_size = int(pool_size or properties['fleet']['pool_size'])
+
+    # Each artefact is downloaded once, into the controller cache
+    prefetched = [artefact for artefact in artefacts.for_tasks(_artefacts(), WORKFLOWS[workflow][1])
+                  if not _streaming(artefact.url)]
+    pool = ThreadPool(properties['prefetch']['workers'])
+    try:
+        paths = pool.map(lambda artefact: _cached_artefact(artefact.url), prefetched)
+    finally:
+        pool.close()
+    artefact_files = [(path, artefact.filename) for artefact, path in zip(prefetched, paths)]
+
+    # Then pushed to a few hosts, which forward it to a few others each, round after round
+    holders = []
+    pending = list(env.hosts)
+    start = time.time()
+    while pending:
+        transfers = distribution.next_round(holders, pending, properties['distribution']['fanout'])
+        pushed = [host for sender, receivers in transfers if sender is None for host in receivers]
+        forwarded = dict((sender, receivers) for sender, receivers in transfers if sender is not None)
+        results = execute(parallel(pool_size=pool_size)(_distribution_round), pushed, forwarded, artefact_files,
+                          hosts=pushed + list(forwarded))
+        for received in results.values():
+            # A host process which died returns its exception instead
+            if isinstance(received, list):
+                holders.extend(received)
+        pending = [host for host in pending if host not in pushed and
+                   not any(host in receivers for receivers in forwarded.values())]
+        logging.info('Distribution round: %d hosts hold the artefacts' % len(holders))
+
+    logging.info('Artefacts distributed to %d of %d hosts in %.1fs, the others download them' % (
+        len(holders), len(env.hosts), time.time() - start))
+
+
+def _distribution_round(pushed, forwarded, artefact_files):
+    """Hosts which received the files: this one when pushed from the controller, or those it forwarded to"""
+    incoming = "%s/%s" % (properties['working_directory'], distribution.INCOMING)
+    try:
+        with settings(warn_only=True):
+            if env.host_string in pushed:
+                run("mkdir -p %s" % incoming)
+                if any(put(path, "%s/%s" % (incoming, filename)).failed for path, filename in artefact_files):
+                    return []
+                run("cd %s && mv %s %s/" % (incoming, " ".join(filename for _, filename in artefact_files),
+                                            properties['working_directory']))
+                return [env.host_string]
+
+            receivers = [(host,) + normalize(host) for host in forwarded[env.host_string]]
+            with settings(forward_agent=True):
+                output = run(distribution.forward_command(properties['working_directory'],
+                                                          [filename for _, filename in artefact_files], receivers,
+                                                          properties['distribution']['accept_unknown_host_keys']))
+            return distribution.received(output)
+    except BaseException as e:
+        logging.error('Distribution from %s failed: %s' % (env.host_string, e))
+        return []
+
+
+def _fleet_host(workflow):
+    # Everything this host prints goes to its own log file, only errors reach the console
+    if not os.path.isdir(properties['fleet']['log_directory']):
+        os.makedirs(properties['fleet']['log_directory'])
+    output = open(os.path.join(properties['fleet']['log_directory'], '%s.log' % env.host), 'w')
+    sys.stdout = sys.stderr = output
+    handler = logging.StreamHandler(output)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    for console in logging.getLogger().handlers:
+        if isinstance(console, logging.StreamHandler) and not isinstance(console, logging.FileHandler):
+            console.setLevel(logging.ERROR)
+    logging.getLogger().addHandler(handler)
+
+    start = time.time()
+    report = {'status': 'success', 'steps': [], 'error': None}
+    try:
+        report['steps'] = _workflow_results(workflow)
+        if any(result.status != 'success' for result in report['steps']):
+            report['status'] = 'failed'
+    except BaseException as e:
+        report['status'] = 'failed'
+        report['error'] = str(e) or e.__class__.__name__
+        logging.error('%s failed on %s: %s' % (workflow, env.host, report['error']))
+    report['duration'] = time.time() - start
+    output.flush()
+    return report
+
+
+def _fleet_report(result):
+    """Report of a host, a failed one when its process died and execute returned the exception instead"""
+    if isinstance(result, dict):
+        return result
+    error = ('%s %s' % (result.__class__.__name__, result)).strip()
+    return {'status': 'failed', 'steps': [], 'error': error, 'duration': 0}
+
+
+def _log_fleet_summary(reports):
+    logging.info('%-30s %-8s %10s  %s' % ('HOST', 'STATUS', 'DURATION', 'FAILED STEPS'))
+    for host, report in sorted(reports.items()):
+        failed = [result.name for result in report['steps'] if result.status != 'success']
+        logging.info('%-30s %-8s %9.1fs  %s' % (host, report['status'], report['duration'],
+                                                ', '.join(failed) or report['error'] or ''))
+
+    steps = {}
+    for report in reports.values():
+        for result in report['steps']:
+            steps.setdefault(result.name, []).append(result)
+    logging.info('%-32s %6s %10s %10s' % ('STEP', 'OK', 'AVERAGE', 'SLOWEST'))
+    for name, results in sorted(steps.items()):
+        durations = [result.end - result.start for result in results]
+        succeeded = len([result for result in results if result.status == 'success'])
+        logging.info('%-32s %3d/%-2d %9.1fs %9.1fs' % (name, succeeded, len(results),
+                                                      sum(durations) / len(durations), max(durations)))
+
+
+def _log_bandwidth_summary(throughput):
+    logging.info('%-30s %9s %10s %10s %10s' % ('HOST', 'DOWNLOADS', 'MB', 'KB/S', 'WAITED'))
+    for host, stats in sorted(throughput.items()):
+        logging.info('%-30s %9d %10.1f %10.0f %9.1fs' % (
+            host, stats['downloads'], stats['bytes'] / 1048576.0,
+            stats['bytes'] / 1024.0 / stats['seconds'] if stats['seconds'] else 0, stats['waited']))
+
+
+# Facts of each host, gathered once per run
+_host_facts = {}
+
+
+@task
+@timed_task
+def gather_facts():
+    require('hosts', provided_by=[set_host])
 
-    tools_install()
-    bfg_repo_cleaner_install()
-    fakeSMTP_install()
-    sublime_text_install()
-    atom_install()
+    paths = [properties['working_directory'], "~/.oh-my-zsh", "~/.m2/repository"] + probes.paths(properties) + \
+            ["%s/%s" % (properties['working_directory'], artefact.filename)
+             for artefact in sorted(_artefacts().values())] + \
+            [artefact.install_path for artefact in sorted(_artefacts().values()) if artefact.name in artefacts.JARS]
+    output = run(facts.gather_command(paths, ["~/.zshrc", "~/.m2/settings.xml", _idea_vmoptions_path()]), quiet=True)
+    host_facts = facts.HostFacts(output)
+    _host_facts[env.host_string] = host_facts
 
-    oh_my_zsh_install()
-    edit_oh_my_zshrc()
+    logging.info('%s: %s, %d CPUs, %d MB RAM, %d MB free disk, %d packages installed' % (
+        env.host_string, host_facts.codename, host_facts.cpus, host_facts.memory_kb / 1024,
+        host_facts.disk_free_kb / 1024, len(host_facts.packages)))
+
+
+def _facts():
+    if env.host_string not in _host_facts:
+        gather_facts()
+    return _host_facts[env.host_string]
+
+
+def _artefacts():
+    """Artefacts of the configuration by name, resolved once when the manifest was compiled"""
+    return properties.artefacts
 
 
 @task
+@timed_task
 def mkdir_working_directory():
     require('hosts', provided_by=[set_host])
 
-    if not files.exists(properties['working_directory']):
-        run("mkdir %s" % properties['working_directory'])
+    if not _facts().exists(properties['working_directory']):
+        run("mkdir -p %s" % properties['working_directory'])
+        _facts().set_exists(properties['working_directory'])
 
 
 @task
+@timed_task
 def rm_working_directory():
     require('hosts', provided_by=[set_host])
 
-    if files.exists(properties['working_directory']):
-        run("rm -rf %s" % properties['working_directory'])
+    run("rm -rf %s" % properties['working_directory'])
+    _host_facts.pop(env.host_string, None)
+
+
+@task
+@timed_task
+def prefetch_artefacts(*task_names):
+    require('hosts', provided_by=[set_host])
+    logging.info('Artefacts prefetch...')
+
+    mkdir_working_directory()
+
+    if task_names:
+        prefetched = artefacts.for_tasks(_artefacts(), task_names)
+    else:
+        prefetched = _artefacts().values()
+    # Streamed archives are piped into tar by their installer instead, and jars already in the store are linked
+    prefetched = [artefact for artefact in prefetched if not _streaming(artefact.url) and not (
+        artefact.name in artefacts.JARS and _facts().exists(artefact.install_path))]
+
+    if properties['cache']['enabled']:
+        # Download into the controller cache concurrently, then push to the host
+        pool = ThreadPool(properties['prefetch']['workers'])
+        try:
+            paths = pool.map(lambda artefact: _cached_artefact(artefact.url), prefetched)
+        finally:
+            pool.close()
+        for artefact, path in zip(prefetched, paths):
+            # Files already pushed by distribute_artefacts, or by an interrupted run, are kept
+            remote_path = "%s/%s" % (properties['working_directory'], artefact.filename)
+            # In a plan, path is the URL of an artefact missing from the cache
+            if os.path.isfile(path) and _facts().size(remote_path) == os.path.getsize(path):
+                logging.info('%s already on host' % artefact.filename)
+                continue
+            put(path, remote_path)
+        logging.info('Artefacts prefetched with success...')
+        return
+
+    # Mirrors of each artefact, fastest first and separated by commas; large artefacts are fetched in segments
+    urls = []
+    segmented = []
+    for artefact in prefetched:
+        mirror_urls = _mirror_urls(artefact.url)
+        size = _segmented_size(mirror_urls[0])
+        if size is None:
+            urls.append(",".join(mirror_urls))
+        else:
+            segmented.append((artefact, mirror_urls[0], size))
+
+    # Each artefact is fetched by its own wget, at most 'workers' at a time; partial files are resumed, from the
+    # next mirror when one fails, and only renamed to the name the installers look for once complete; %s is the
+    # wget command, rate limited by the download slot
+    wget = "wget"
+    if properties['proxy']['host'] is not None:
+        wget = wget + " -e use_proxy=yes -e http_proxy=$http_proxy"
+    fetch = ('start=$(date +%%s); for url in $(echo "$0" | tr , " "); do file=$(basename "$url"); '
+             '%s -nv -c -O "$file.part" "$url" && mv "$file.part" "$file" && '
+             'echo "prefetched $file in $(($(date +%%s) - start))s" && stat -c "@@downloaded %%s" "$file" && '
+             'exit 0; done; exit 1')
+
+    with cd(properties['working_directory']):
+        with settings(warn_only=True):
+            results = []
+            if urls:
+                # One slot for the whole pool, as many connections as wget processes at the same time
+                workers = min(properties['prefetch']['workers'], len(urls))
+                priority = max(_download_priority(artefact.url) for artefact in prefetched)
+                with bandwidth.slot(env.host, priority, workers) as slot:
+                    results.append(run("printf '%%s\\n' %s | xargs -n 1 -P %s sh -c '%s'" % (
+                        " ".join(urls), workers, fetch % _rate_limited(wget, slot))))
+                    slot.size = bandwidth.downloaded(results[-1])
+            for artefact, url, size in segmented:
+                with bandwidth.slot(env.host, _download_priority(artefact.url),
+                                    properties['segmented']['segments']) as slot:
+                    results.append(run("{ %s; } && stat -c '@@downloaded %%s' %s" % (
+                        downloads.shell_command(url, artefact.filename, size, properties['segmented']['segments'],
+                                                _rate_limited(wget, slot), artefact.sha256), artefact.filename)))
+                    slot.size = bandwidth.downloaded(results[-1])
+        if any(result.failed for result in results):
+            logging.warning('Some artefacts could not be prefetched, they will be downloaded by their installer')
+
+    logging.info('Artefacts prefetched with success...')
 
 
 @task
+@timed_task
 def maven_install():
     logging.info('Maven install...')
 
+    # Settings and repository of the user are set up even when Maven itself is current
+    _write_maven_settings()
+    _seed_maven_repository()
+
+    if _is_current('maven_install'):
+        logging.info('Maven already installed with expected version...')
+        return
+
     mkdir_working_directory()
 
     with cd(properties['working_directory']):
-        mvn_artefact = properties['maven']['artefact'] % properties['maven']['version']
-        mvn_url = properties['maven']['url'] % (properties['maven']['version'], mvn_artefact)
-        _wget(mvn_url, properties['proxy']['host'] is not None)
+        maven = _artefacts()['maven']
+        _extract_archive(maven.url, "/opt", posixpath.basename(maven.install_path), useSudo=True)
         with cd("/opt"):
-            sudo("tar xvzf %s/%s" % (properties['working_directory'], mvn_artefact))
-            if files.exists("maven"):
-                sudo("unlink maven")
-            sudo("ln -s %s/apache-maven-%s maven" % ("/opt", properties['maven']['version']))
+            sudo("ln -sfn %s maven" % maven.install_path)
             run("export PATH=%s/bin:$PATH" % ("/opt/maven"))
-        run("rm -rf %s " % mvn_artefact)
+
+    _mark_installed('maven_install')
 
     logging.info('Maven installed with success...')
 
 
+# Header comment of the settings.xml files generated from resources/maven_settings.template
+MAVEN_SETTINGS_MARKER = 'Generated by dev-workstation-installer'
+
+
+def _write_maven_settings():
+    # Left to the developer when there is nothing to configure
+    if properties['maven']['mirror_url'] is None and properties['proxy']['host'] is None:
+        return
+    settings_xml = _render_maven_settings()
+    if _facts().sha256("~/.m2/settings.xml") != hashlib.sha256(settings_xml.encode('utf-8')).hexdigest():
+        # A file the installer did not generate is kept aside, with its servers and profiles
+        run("mkdir -p ~/.m2 && if [ -f ~/.m2/settings.xml ] && ! grep -q '%s' ~/.m2/settings.xml; then "
+            "cp ~/.m2/settings.xml ~/.m2/settings.xml.$(date +%%Y%%m%%d%%H%%M%%S); fi" % MAVEN_SETTINGS_MARKER)
+        put(StringIO(settings_xml), ".m2/settings.xml")
+
+
+def _render_maven_settings():
+    mirrors = ""
+    if properties['maven']['mirror_url'] is not None:
+        mirrors = "\n".join([
+            "    <mirror>",
+            "      <id>dev-workstation-mirror</id>",
+            "      <mirrorOf>*</mirrorOf>",
+            "      <url>%s</url>" % escape(properties['maven']['mirror_url']),
+            "    </mirror>",
+            ""])
+    proxies = ""
+    if properties['proxy']['host'] is not None:
+        proxies = "".join("\n".join([
+            "    <proxy>",
+            "      <id>proxy-%s</id>" % protocol,
+            "      <protocol>%s</protocol>" % protocol,
+            "      <host>%s</host>" % escape(str(properties['proxy']['host'])),
+            "      <port>%s</port>" % properties['proxy']['port']] + _maven_proxy_credentials() + [
+            "      <nonProxyHosts>localhost|127.0.0.1</nonProxyHosts>",
+            "    </proxy>",
+            ""]) for protocol in ('http', 'https'))
+
+    with open("resources/maven_settings.template", 'r') as template:
+        return template.read() % {'mirrors': mirrors, 'proxies': proxies}
+
+
+def _maven_proxy_credentials():
+    if properties['proxy']['username'] is None:
+        return []
+    return ["      <username>%s</username>" % escape(str(properties['proxy']['username'])),
+            "      <password>%s</password>" % escape(str(properties['proxy']['pwd']))]
+
+
+def _seed_maven_repository():
+    # A fresh host gets the artefacts of the archive instead of downloading them on its first builds
+    seed_archive = properties['maven']['seed_archive']
+    if seed_archive is None or _facts().exists("~/.m2/repository"):
+        return
+    if not os.path.isfile(seed_archive):
+        logging.warning('Maven repository seed %s not found, first builds download every dependency' % seed_archive)
+        return
+    remote_archive = "%s/m2-repository-seed.tar.gz" % properties['working_directory']
+    put(seed_archive, remote_archive)
+    run("mkdir -p ~/.m2/repository && tar xzf %s -C ~/.m2/repository && rm -f %s" % (remote_archive, remote_archive))
+
+
 @task
+@timed_task
 def ant_install():
     logging.info('Ant install...')
 
+    if _is_current('ant_install'):
+        logging.info('Ant already installed with expected version...')
+        return
+
     mkdir_working_directory()
 
     with cd(properties['working_directory']):
-        ant_artefact = properties['ant']['artefact'] % properties['ant']['version']
-        ant_url = properties['ant']['url'] % ant_artefact
-        _wget(ant_url, properties['proxy']['host'] is not None)
+        ant = _artefacts()['ant']
+        _extract_archive(ant.url, "/opt", posixpath.basename(ant.install_path), useSudo=True)
         with cd("/opt"):
-            sudo("tar xvzf %s/%s" % (properties['working_directory'], ant_artefact))
-            if files.exists("ant"):
-                sudo("unlink ant")
-            sudo("ln -s %s/apache-ant-%s ant" % ("/opt", properties['ant']['version']))
+            sudo("ln -sfn %s ant" % ant.install_path)
             run("export PATH=%s/bin:$PATH" % ("/opt/ant"))
-        run("rm -rf %s " % ant_artefact)
+
+    _mark_installed('ant_install')
 
     logging.info('ant installed with success...')
 
 
 @task
-def java_install():
-    logging.info('Java JDK install...')
+@timed_task
+def apt_install(*task_names):
+    require('hosts', provided_by=[set_host])
+    logging.info('Apt packages install...')
 
-    mkdir_working_directory()
-    sudo("apt-add-repository -y ppa:openjdk-r/ppa")
+    plan = apt_plan.AptPlan()
+    for task_name in task_names:
+        APT_PLANS[task_name](plan)
+    _apply_apt_plan(plan)
+
+    logging.info('Apt packages installed with success...')
+
+
+def _apply_apt_plan(plan):
+    with settings(warn_only=True):
+        installed = run("dpkg-query -W -f='%s' %s" % (apt_plan.DPKG_QUERY_FORMAT,
+                                                      " ".join(plan.prerequisites + plan.packages)))
+    if dry_run.active():
+        installed = "\n".join("%s install ok installed" % package
+                              for package in list(_facts().packages) + dry_run.installed_packages())
+
+    missing_packages = apt_plan.missing_packages(plan.packages, installed)
+    if not missing_packages:
+        logging.info('All apt packages already installed')
+        return
+
+    repository = properties['apt']['repository']
+    if properties['apt']['bundle']['push']:
+        repository = _push_apt_bundle()
+    if repository is not None:
+        for cmd in apt_plan.local_repository_commands(repository):
+            sudo(cmd)
+        sudo("apt-get -y install %s" % " ".join(missing_packages))
+        return
+
+    _add_apt_repositories(plan, installed)
     sudo("apt-get update")
-    sudo("apt-get -y install openjdk-%s-jdk" % properties['java']['version'])
+    sudo("apt-get -y install %s" % " ".join(missing_packages))
 
-    logging.info('Java installed with success...')
+
+def _add_apt_repositories(plan, installed):
+    missing_prerequisites = apt_plan.missing_packages(plan.prerequisites, installed)
+    if missing_prerequisites:
+        sudo("apt-get -y install %s" % " ".join(missing_prerequisites))
+
+    for cmd in plan.key_commands(properties['proxy']['host'] is not None):
+        run(cmd)
+    for cmd in plan.repository_commands():
+        sudo(cmd)
 
 
 @task
-def liquibase_install():
-    logging.info('Liquibase install...')
+@runs_once
+@timed_task
+def apt_bundle(workflow='my_install_workstation'):
+    require('hosts', provided_by=[set_host])
+    logging.info('Apt bundle...')
 
+    # The packages are resolved on the host, with the repositories of the tasks, for its codename
+    plan = apt_plan.AptPlan()
+    for task_name in WORKFLOWS[workflow][0]:
+        APT_PLANS[task_name](plan)
     with settings(warn_only=True):
-        installed_liquibase = run('which liquibase')
-        print str(installed_liquibase)
+        installed = run("dpkg-query -W -f='%s' %s" % (apt_plan.DPKG_QUERY_FORMAT, " ".join(plan.prerequisites)))
+    _add_apt_repositories(plan, installed)
+    sudo("apt-get update")
+    # apt-ftparchive, which indexes the bundle, is not part of a minimal install
+    if 'apt-utils' not in _facts().packages:
+        sudo("apt-get install -y apt-utils")
+
+    remote_directory = run("mktemp -d").strip()
+    with cd(remote_directory):
+        for cmd in apt_plan.bundle_commands(plan.prerequisites + plan.packages):
+            run(cmd)
+        run("tar cf %s.tar ." % remote_directory)
+
+    # Kept as an archive to push to the hosts, and extracted to be served or inspected
+    local_directory = os.path.join(properties['apt']['bundle']['directory'], _facts().codename)
+    if os.path.isdir(local_directory):
+        shutil.rmtree(local_directory)
+    os.makedirs(local_directory)
+    get("%s.tar" % remote_directory, local_directory + ".tar")
+    run("rm -rf %s %s.tar" % (remote_directory, remote_directory))
+    with tarfile.open(local_directory + ".tar") as archive:
+        archive.extractall(local_directory)
+
+    logging.info('Apt bundle of %d packages written to %s' % (
+        len([name for name in os.listdir(local_directory) if name.endswith('.deb')]), local_directory))
+
+
+def _push_apt_bundle():
+    """Copy the apt bundle of the host's codename to the host, unless it already has it, and return its URL"""
+    local_directory = os.path.join(properties['apt']['bundle']['directory'], _facts().codename or '')
+    if not os.path.exists(os.path.join(local_directory, 'Packages')):
+        abort('No apt bundle in %s, build it with: fab set_host apt_bundle' % local_directory)
+    with open(os.path.join(local_directory, 'Packages'), 'rb') as packages:
+        digest = hashlib.sha256(packages.read()).hexdigest()
 
-    if installed_liquibase.failed:
-        install_liquibase = True
-        current_liquibase_version = 0
-        print "Installing Liquibase %s" % properties['liquibase']['version']
+    with settings(warn_only=True):
+        remote_digest = run("cat %s/Packages 2>/dev/null | sha256sum" % apt_plan.BUNDLE_DIRECTORY)
+    if remote_digest.split()[:1] == [digest]:
+        logging.info('Apt bundle already on host')
     else:
-        current_liquibase_version = run('liquibase --version')
+        archive = "%s/apt-bundle.tar" % properties['working_directory']
+        put(local_directory + ".tar", archive)
+        sudo("mkdir -p %s && rm -rf %s/* && tar xf %s -C %s && rm -f %s" % (
+            apt_plan.BUNDLE_DIRECTORY, apt_plan.BUNDLE_DIRECTORY, archive, apt_plan.BUNDLE_DIRECTORY, archive))
+    return "file:" + apt_plan.BUNDLE_DIRECTORY
+
+
+def _java_apt_plan(plan):
+    plan.add_prerequisites("software-properties-common")
+    plan.add_ppa("openjdk-r/ppa")
+    plan.add_packages("openjdk-%s-jdk" % properties['java']['version'])
+
+
+def _git_apt_plan(plan):
+    plan.add_packages("git", "git-extras")
+
+
+def _tools_apt_plan(plan):
+    plan.add_packages("filezilla", "htop", "keepassx", "terminator", "owncloud-client", "gimp", "vim", "unzip")
+
+
+def _spotify_apt_plan(plan):
+    plan.add_source("spotify", "deb http://repository.spotify.com stable non-free")
+    plan.add_packages("spotify-client")
+
+
+def _sublime_text_apt_plan(plan):
+    plan.add_prerequisites("apt-transport-https")
+    plan.add_key("https://download.sublimetext.com/sublimehq-pub.gpg")
+    plan.add_source("sublime-text", "deb https://download.sublimetext.com/ apt/stable/")
+    plan.add_packages("sublime-text")
+
+
+def _atom_apt_plan(plan):
+    plan.add_prerequisites("apt-transport-https")
+    plan.add_key("https://packagecloud.io/AtomEditor/atom/gpgkey")
+    plan.add_source("atom", "deb [arch=amd64] https://packagecloud.io/AtomEditor/atom/any/ any main")
+    plan.add_packages("atom")
+
 
-    if current_liquibase_version != properties['liquibase']['version']:
-        install_liquibase = True
-        print "Updating Liquibase from %s to %s" % (current_liquibase_version, properties['liquibase']['version'])
+def _postgresql_apt_plan(plan):
+    plan.add_key("https://www.postgresql.org/media/keys/ACCC4CF8.asc")
+    plan.add_source("pgdg",
+                    "deb http://apt.postgresql.org/pub/repos/apt/ %s-pgdg main" % _facts().codename)
+    plan.add_packages("postgresql-%s" % properties['postgres']['version'], "pgadmin3")
+    if properties['postgres']['tuning']['enabled'] and pg_tuning.contrib_package(properties['postgres']['version']):
+        plan.add_packages(pg_tuning.contrib_package(properties['postgres']['version']))
+
+
+def _oh_my_zsh_apt_plan(plan):
+    plan.add_packages("zsh")
+
+
+# Apt repositories, keys and packages needed by each task
+APT_PLANS = {
+    'java_install': _java_apt_plan,
+    'git_install': _git_apt_plan,
+    'tools_install': _tools_apt_plan,
+    'spotify_install': _spotify_apt_plan,
+    'sublime_text_install': _sublime_text_apt_plan,
+    'atom_install': _atom_apt_plan,
+    'postgresql_install': _postgresql_apt_plan,
+    'oh_my_zsh_install': _oh_my_zsh_apt_plan,
+}
+
+
+@task
+@timed_task
+def java_install():
+    logging.info('Java JDK install...')
+    apt_install('java_install')
+    logging.info('Java installed with success...')
+
+
+@task
+@timed_task
+def liquibase_install():
+    logging.info('Liquibase install...')
+
+    if _is_current('liquibase_install'):
+        logging.info('Liquibase already installed with expected version...')
+        _link_jars('liquibase_install')
+        return
 
     mkdir_working_directory()
     with cd(properties['working_directory']):
-        if install_liquibase:
-            liquibase_url = properties['liquibase']['url'] % (properties['liquibase']['version'], properties['liquibase']['version'])
-            postgres_driver_url = properties['driver']['postgres.url'] % (
-                properties['driver']['postgres.version'], properties['driver']['postgres.version'])
-            run("wget %s" % liquibase_url)
-            sudo("dpkg -i liquibase-debian_%s_all.deb" % properties['liquibase']['version'])
-            if files.exists("/opt/liquibase"):
-                sudo("unlink /opt/liquibase")
-            sudo("ln -s /usr/lib/liquibase-%s /opt/liquibase" % properties['liquibase']['version'])
-            with cd("/opt/liquibase/lib"):
-                sudo("rm -rf postgresql*.jar")
-                sudo("wget %s" % postgres_driver_url)
-            run("rm -rf liquibase-debian_%s_all.deb" % properties['liquibase']['version'])
-            current_liquibase_version = run("liquibase --version")
-            print "Liquibase %s installed." % current_liquibase_version
-        else:
-            print "Liquibase already installed with expected version."
+        liquibase = _artefacts()['liquibase']
+        _wget(liquibase.url, properties['proxy']['host'] is not None)
+        sudo("dpkg -i %s" % liquibase.filename)
+        sudo("ln -sfn %s /opt/liquibase" % liquibase.install_path)
+        _link_jars('liquibase_install')
+        run("rm -rf %s" % liquibase.filename)
+        run("liquibase --version")
+
+    _mark_installed('liquibase_install')
 
     logging.info('Liquibase installed with success...')
 
 
 @task
+@timed_task
 def schemacrawler_install():
     logging.info('Schemacrawler install...')
 
+    if _is_current('schemacrawler_install'):
+        logging.info('Schemacrawler already installed with expected version...')
+        return
+
     mkdir_working_directory()
 
     with cd(properties['working_directory']):
-        schemacrawler_url = properties['schemacrawler']['url'] % (
-            properties['schemacrawler']['version'], properties['schemacrawler']['version'])
-        run("wget %s" % schemacrawler_url)
-        sudo("dpkg -i schemacrawler-deb_%s_all.deb" % properties['schemacrawler']['version'])
+        schemacrawler = _artefacts()['schemacrawler']
+        _wget(schemacrawler.url, properties['proxy']['host'] is not None)
+        sudo("dpkg -i %s" % schemacrawler.filename)
         sudo("mv /opt/schemacrawler/additional-lints/schemacrawler-additional-lints-*.jar /opt/schemacrawler/lib")
         sudo("chmod +rx /opt/schemacrawler/lib/schemacrawler-additional-lints-*.jar")
         run("schemacrawler --version")
-        run("rm -rf schemacrawler-deb_%s_all.deb" % properties['schemacrawler']['version'])
+        run("rm -rf %s" % schemacrawler.filename)
+
+    _mark_installed('schemacrawler_install')
 
     logging.info('Schemacrawler installed with success...')
 
 
 @task
+@timed_task
 def git_install():
     logging.info('Git install...')
-    sudo("apt-get -y install git git-extras")
+    apt_install('git_install')
     logging.info('Git installed with success...')
 
 
 @task
+@timed_task
 def tools_install():
     logging.info('Tools install...')
-
-    sudo("apt-get -y install filezilla")
-    sudo("apt-get -y install htop")
-    sudo("apt-get -y install keepassx")
-    sudo("apt-get -y install terminator")
-    sudo("apt-get -y install owncloud-client")
-    sudo("apt-get -y install gimp")
-    sudo("apt-get -y install vim")
-    sudo("apt-get -y install unzip")
-
+    apt_install('tools_install')
     logging.info('Tools installed with success...')
 
 
 @task
+@timed_task
 def spotify_install():
     logging.info('Spotify install...')
-
-    sudo("echo deb http://repository.spotify.com stable non-free | tee /etc/apt/sources.list.d/spotify.list")
-    sudo("apt-get -y install spotify-client")
-
+    apt_install('spotify_install')
     logging.info('Spotify installed with success...')
 
 
 @task
+@timed_task
 def sublime_text_install():
     logging.info('Sublime Text install...')
-
-    cmd = "wget -qO - https://download.sublimetext.com/sublimehq-pub.gpg"
-    if properties['proxy']['host'] is not None:
-        cmd = cmd + " -e use_proxy=yes -e http_proxy=$http_proxy"
-    cmd = cmd + " | sudo apt-key add -"
-    run(cmd)
-    sudo("apt-get install apt-transport-https")
-
-    sudo("deb https://download.sublimetext.com/ apt/stable/ | tee /etc/apt/sources.list.d/sublime-text.list")
-    sudo("apt-get update")
-    sudo("apt-get -y install sublime-text")
-
+    apt_install('sublime_text_install')
     logging.info('Sublime Text installed with success...')
 
 
 @task
+@timed_task
 def atom_install():
-    sudo("curl -L https://packagecloud.io/AtomEditor/atom/gpgkey | apt-key add -")
-    sudo(
-        'echo "deb [arch=amd64] https://packagecloud.io/AtomEditor/atom/any/ any main" > /etc/apt/sources.list.d/atom.list')
-    sudo("apt-get update")
-    sudo("apt-get -y install atom")
+    logging.info('Atom install...')
+    apt_install('atom_install')
+    logging.info('Atom installed with success...')
 
 
 @task
+@timed_task
 def bfg_repo_cleaner_install():
     logging.info('BFG Repo Cleaner install...')
 
+    if _is_current('bfg_repo_cleaner_install'):
+        logging.info('BFG Repo Cleaner already installed with expected version...')
+        return
+
     mkdir_working_directory()
     with cd(properties['working_directory']):
-        if files.exists("bfg-repo-cleaner"):
-            run("rm -rf bfg-repo-cleaner")
-
-        run("mkdir bfg-repo-cleaner")
-        version = properties['bfg_cleaner']['version']
-        with cd("bfg-repo-cleaner"):
-            bfg_url = properties['bfg_cleaner']['url'] % (version, version)
-            run("wget %s -O bfg.jar" % bfg_url)
+        bfg_cleaner = _artefacts()['bfg_cleaner']
+        run("rm -rf %s && mkdir %s" % (bfg_cleaner.install_path, bfg_cleaner.install_path))
+        with cd(bfg_cleaner.install_path):
+            _wget(bfg_cleaner.url, properties['proxy']['host'] is not None, output="bfg.jar")
             sudo("chmod +x bfg.jar")
 
+    _mark_installed('bfg_repo_cleaner_install')
+
     logging.info('BFG Repo Cleaner installed with success...')
 
 
 @task
+@timed_task
 def fakeSMTP_install():
     logging.info('FakeSMTP install...')
 
+    if _is_current('fakeSMTP_install'):
+        logging.info('FakeSMTP already installed with expected version...')
+        return
+
     mkdir_working_directory()
     with cd(properties['working_directory']):
-        if files.exists("fakeSMTP"):
-            run("rm -rf fakeSMTP")
-        run("mkdir fakeSMTP")
-        with cd("fakeSMTP"):
-            run("wget %s" % properties['fakeSMTP']['url'])
-            run("unzip fakeSMTP-latest.zip ")
+        fake_smtp = _artefacts()['fakeSMTP']
+        run("rm -rf %s && mkdir %s" % (fake_smtp.install_path, fake_smtp.install_path))
+        with cd(fake_smtp.install_path):
+            _wget(fake_smtp.url, properties['proxy']['host'] is not None)
+            run("unzip %s " % fake_smtp.filename)
             run("mkdir received-emails")
 
+    _mark_installed('fakeSMTP_install')
+
     logging.info('FakeSMTP installed with success...')
 
 
 @task
+@timed_task
 def intellij_install():
     logging.info('Intellij install...')
 
+    if _is_current('intellij_install'):
+        logging.info('Intellij already installed with expected version...')
+        return
+
     mkdir_working_directory()
 
     with cd(properties['working_directory']):
-        intellij_artefact = properties['intellij']['artefact'] % properties['intellij']['version']
-        intellij_url = properties['intellij']['url'] % intellij_artefact
-        if not files.exists(intellij_artefact):
-            run("wget %s" % intellij_url)
-        run("tar xvzf %s" % intellij_artefact)
-        if files.exists("intellij"):
-            run("unlink intellij")
-        run("ln -s %s intellij" % properties['intellij']['build'])
-        run("rm -rf %s" % intellij_artefact)
+        intellij = _artefacts()['intellij']
+        _extract_archive(intellij.url, properties['working_directory'], posixpath.basename(intellij.install_path))
+        run("ln -sfn %s intellij" % posixpath.basename(intellij.install_path))
+
+    _mark_installed('intellij_install')
 
     logging.info('Intellij installed with success...')
 
 
 @task
+@timed_task
 def datagrip_install():
     logging.info('DataGrip install...')
 
+    if _is_current('datagrip_install'):
+        logging.info('DataGrip already installed with expected version...')
+        return
+
     mkdir_working_directory()
 
     with cd(properties['working_directory']):
-        datagrip_artefact = properties['datagrip']['artefact'] % properties['datagrip']['version']
-        datagrip_url = properties['datagrip']['url'] % datagrip_artefact
-        if not files.exists(datagrip_artefact):
-            run("wget %s" % datagrip_url)
-        run("tar xvzf %s" % datagrip_artefact)
-        if files.exists("datagrip"):
-            run("unlink datagrip")
-        run("ln -s DataGrip-%s datagrip" % properties['datagrip']['version'])
-        run("rm -rf %s" % datagrip_artefact)
+        datagrip = _artefacts()['datagrip']
+        _extract_archive(datagrip.url, properties['working_directory'], posixpath.basename(datagrip.install_path))
+        run("ln -sfn %s datagrip" % posixpath.basename(datagrip.install_path))
+
+    _mark_installed('datagrip_install')
 
     logging.info('Datagrip installed with success...')
 
 
 @task
+@timed_task
 def oh_my_zsh_install():
     logging.info('Oh My Zsh install...')
 
     if properties['proxy']['host'] is not None:
-        proxy_addr = "https://%s:%s@%s:%s" % (
-            properties['proxy']['username'], properties['proxy']['pwd'], properties['proxy']['host'],
-            properties['proxy']['port'])
-        run("git config --global https.proxy %s" % proxy_addr)
+        run("git config --global https.proxy %s" % _proxy_address('https'))
+
+    apt_install('oh_my_zsh_install')
 
     with cd("~"):
-        if files.exists("./.oh-my-zsh"):
+        if _facts().exists("~/.oh-my-zsh"):
             with cd(".oh-my-zsh"):
                 run("git pull origin master")
         else:
-            run("git clone https://github.com/robbyrussell/oh-my-zsh.git ./.oh-my-zsh")
-            run("cp ~/.oh-my-zsh/templates/zshrc.zsh-template ~/.zshrc")
-            sudo("apt-get -y install zsh")
+            run("git clone %s ./.oh-my-zsh" % properties['oh-my-zsh']['repository'])
         sudo("chsh -s $(which zsh) %s" % properties['user'])
         # run("curl -fsSL https://raw.githubusercontent.com/robbyrussell/oh-my-zsh/master/tools/install.sh")
 
@@ -369,41 +1033,38 @@ def oh_my_zsh_install():
 
 
 @task
+@timed_task
 def apache_directory_studio_install():
     logging.info('Apache Directory Studio install...')
 
+    if _is_current('apache_directory_studio_install'):
+        logging.info('Apache Directory Studio already installed with expected version...')
+        return
+
     mkdir_working_directory()
 
     with cd(properties['working_directory']):
-        version = properties['ads']['version']
-        ads_artefact = properties['ads']['artefact'] % version
-        ads_url = properties['ads']['url'] % (version, ads_artefact)
-        _wget(ads_url, properties['proxy']['host'] is not None)
-        # run("wget %s" % ads_url)
-        if files.exists("ApacheDirectoryStudio"):
-            run("rm -rf ApacheDirectoryStudio")
-        run("tar xvzf %s" % ads_artefact)
+        ads = _artefacts()['ads']
+        _extract_archive(ads.url, properties['working_directory'], posixpath.basename(ads.install_path))
 
-        run("rm -rf %s" % ads_artefact)
+    _mark_installed('apache_directory_studio_install')
 
     logging.info('Apache Directory Studio installed with success...')
 
 
 @task
+@timed_task
 def postgresql_install():
     logging.info('PostgreSQL install...')
+    apt_install('postgresql_install')
+    postgresql_configure()
+    logging.info('PostgreSQL installed with success...')
 
-    ubuntu_version = properties['ubuntu']['codename']
-    url = "deb http://apt.postgresql.org/pub/repos/apt/ %s-pgdg main" % ubuntu_version
 
-    if not files.exists("/etc/apt/sources.list.d/pgdg.list"):
-        files.append("/etc/apt/sources.list.d/pgdg.list", "#create file with Fabric", True)
-
-    _append_to_file(url, "/etc/apt/sources.list.d/pgdg.list", True)
-
-    sudo("wget --quiet -O - https://www.postgresql.org/media/keys/ACCC4CF8.asc | apt-key add -")
-    sudo("apt-get update")
-    sudo("apt-get -y install postgresql-%s pgadmin3" % properties['postgres']['version'])
+@task
+@timed_task
+def postgresql_configure():
+    logging.info('PostgreSQL configuration...')
 
     old_pghba_postgres = "local   all             postgres                                peer"
     new_pghba_postgres = "local   all             postgres                                trust"
@@ -420,185 +1081,414 @@ def postgresql_install():
                                                           password=properties['postgres']['pwd']))
     _run_as_pg('''psql -c "ALTER ROLE postgres WITH PASSWORD '%s';"''' % properties['postgres']['pwd'])
 
+    if properties['postgres']['tuning']['enabled']:
+        postgresql_tune()
+
+    logging.info('PostgreSQL configured with success...')
+
+
+@task
+@timed_task
+def postgresql_tune():
+    logging.info('PostgreSQL tuning...')
+
+    version = properties['postgres']['version']
+    pairs = pg_tuning.settings(properties['postgres']['tuning'], version, _facts().memory_kb, _facts().cpus)
+    conf = pg_tuning.conf(pairs)
+    main_directory = "/etc/postgresql/%s/main" % version
+    conf_path = "%s/conf.d/%s" % (main_directory, pg_tuning.CONF_FILE)
+
+    with settings(warn_only=True):
+        current = sudo("sha256sum %s 2>/dev/null" % conf_path)
+    if current.split()[:1] == [hashlib.sha256(conf).hexdigest()]:
+        logging.info('PostgreSQL already tuned...')
+        return
+
+    before = _pgbench()
+    # Clusters of older versions do not include conf.d
+    sudo("mkdir -p %s/conf.d && (grep -q \"^include_dir = 'conf.d'\" %s/postgresql.conf || "
+         "echo \"include_dir = 'conf.d'\" >> %s/postgresql.conf)" % (main_directory, main_directory, main_directory))
+    put(StringIO(conf), conf_path, use_sudo=True)
+    sudo("service postgresql restart %s" % version)
+    after = _pgbench()
+
+    logging.info('PostgreSQL settings: %s' % ', '.join('%s=%s' % pair for pair in pairs))
+    if before and after:
+        logging.info('pgbench: %.0f tps before tuning, %.0f tps after (%+.0f%%)' % (
+            before, after, (after / before - 1) * 100))
+
+    logging.info('PostgreSQL tuned with success...')
+
+
+def _pgbench():
+    """Transactions per second of a short pgbench on a fresh database, None when skipped or failed"""
+    version = properties['postgres']['version']
+    bench = properties['postgres']['tuning']['pgbench']
+    if not bench['seconds']:
+        return None
+    with settings(warn_only=True):
+        _run_as_pg(pg_tuning.init_command(version, bench))
+        output = _run_as_pg(pg_tuning.bench_command(version, bench))
+        _run_as_pg("dropdb --if-exists %s" % pg_tuning.BENCH_DATABASE)
+    return pg_tuning.tps(output)
+
 
 def _run_as_pg(command):
     return sudo('su - postgres << EOF\n%s\nEOF' % command)
 
 
 @task
+@timed_task
 def apache_tomcat_install():
     logging.info('Apache Tomcat install...')
 
+    if _is_current('apache_tomcat_install'):
+        logging.info('Apache Tomcat already installed with expected version...')
+        _link_jars('apache_tomcat_install')
+        return
+
     mkdir_working_directory()
 
     with cd(properties['working_directory']):
-        version = properties['tomcat']['version']
-        artefact = properties['tomcat']['artefact'] % version
-        major = properties['tomcat']['major']
-        url = properties['tomcat']['url'] % (major, version, artefact)
+        tomcat = _artefacts()['tomcat']
+        _extract_archive(tomcat.url, properties['working_directory'], posixpath.basename(tomcat.install_path))
+        run("ln -sfn %s tomcat" % posixpath.basename(tomcat.install_path))
 
-        if not files.exists(artefact):
-            _wget(url, properties['proxy']['host'] is not None)
-            # run("wget %s" % url)
-
-        if files.exists("tomcat"):
-            run("rm -rf tomcat")
-
-        run("tar xvzf %s" % artefact)
-        run("ln -s apache-tomcat-%s tomcat" % version)
-
-        postgres_driver_url = properties['driver']['postgres.url'] % (
-            properties['driver']['postgres.version'], properties['driver']['postgres.version'])
-        h2_driver_url = properties['driver']['h2.url'] % (
-            properties['driver']['h2.version'], properties['driver']['h2.version'])
-        javax_mail_url = properties['javax.mail']['url'] % (
-            properties['javax.mail']['version'], properties['javax.mail']['version'])
-        jt400_url = properties['driver']['jt400.url'] % (
-            properties['driver']['jt400.version'], properties['driver']['jt400.version'])
-        activation_url = properties['activation']['url'] % (
-            properties['activation']['version'], properties['activation']['version'])
-
-        with cd("./tomcat/lib"):
-            _wget(postgres_driver_url, properties['proxy']['host'] is not None)
-            _wget(h2_driver_url, properties['proxy']['host'] is not None)
-            _wget(javax_mail_url, properties['proxy']['host'] is not None)
-            _wget(jt400_url, properties['proxy']['host'] is not None)
-            _wget(activation_url, properties['proxy']['host'] is not None)
-            # run("wget %s" % postgres_driver_url)
-            # run("wget %s" % h2_driver_url)
-            # run("wget %s" % javax_mail_url)
-            # run("wget %s" % jt400_url)
-            # run("wget %s" % activation_url)
-
-    run("rm -rf %s" % artefact)
+    _link_jars('apache_tomcat_install')
+    _mark_installed('apache_tomcat_install')
 
     logging.info('Apache Tomcat installed with success...')
 
 
-def _append_to_file(text, file, useSudo=False):
-    cmd = "sed -i \"$ a " + text + "\" " + file
+def _jar_consumers():
+    # Lib directory of each installer using shared jars, the jars it uses, and whether root owns the directory
+    return {
+        'liquibase_install': ('/opt/liquibase/lib', ['postgres.driver'], True),
+        'apache_tomcat_install': ('%s/tomcat/lib' % properties['working_directory'],
+                                  ['postgres.driver', 'h2.driver', 'javax.mail', 'jt400.driver', 'activation'], False),
+    }
+
+
+def _stored_jar(url):
+    """Path of the jar of url in the jar store of the host, fetched on first use"""
+    path = artefacts.jar_store_path(properties, url)
+    if not _facts().exists(path) and not exists(path):
+        # Fetched under a name of its own, so that installers running at the same time never see a partial jar
+        partial = "%s.%d" % (posixpath.basename(path), os.getpid())
+        run("mkdir -p %s" % posixpath.dirname(path))
+        with cd(posixpath.dirname(path)):
+            _wget(url, properties['proxy']['host'] is not None, output=partial)
+            run("mv %s %s" % (partial, posixpath.basename(path)))
+        _facts().set_exists(path)
+    return path
+
+
+def _link_jars(task_name):
+    """Link the configured version of the shared jars of an installer into its lib directory, replacing others"""
+    lib_directory, names, useSudo = _jar_consumers()[task_name]
+    resolved = _artefacts()
+    links = []
+    for name in names:
+        path = _stored_jar(resolved[name].url)
+        # Hard links share the copy of the store, symbolic links are used across file systems
+        links.append("rm -f %s/%s-*.jar && { ln -f %s %s/ 2>/dev/null || ln -sf %s %s/; }" % (
+            lib_directory, artefacts.artifact_id(resolved[name].url), path, lib_directory, path, lib_directory))
+    cmd = " && ".join(links)
     if useSudo:
         sudo(cmd)
     else:
         run(cmd)
 
 
+@task
+@timed_task
+def relink_jars():
+    require('hosts', provided_by=[set_host])
+    logging.info('Shared jars relink...')
+
+    for task_name, (lib_directory, _, _) in sorted(_jar_consumers().items()):
+        if exists(lib_directory):
+            _link_jars(task_name)
+
+    logging.info('Shared jars relinked with success...')
+
+
 def _put_double_quote_around_string(text, file):
     cmd = "sed 's/\b" + text + "\b/" + text + "/' -i " + file
     print cmd
     run(cmd)
 
 
-def _wget(url, useProxy=False):
-    if useProxy:
-        run("wget " + url + " -e use_proxy=yes -e http_proxy=$http_proxy")
-    else:
-        run("wget " + url)
+def _flag(name):
+    """Switch set with fab --set name=..., only 1, true or yes turning it on"""
+    return _true(env.get(name, ''))
+
+
+def _true(value):
+    """Boolean of a switch or task argument, given as a string by Fabric"""
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def _is_current(task_name):
+    if _flag('force_install'):
+        return False
+    return probes.is_current(probes.probe(properties, task_name), _facts())
+
+
+def _mark_installed(task_name):
+    if probes.uses_marker(properties, task_name):
+        marker = probes.marker_path(properties, task_name)
+        run("mkdir -p %s && echo %s > %s" % (posixpath.dirname(marker), probes.config_hash(properties, task_name),
+                                               marker))
+
+
+def _streaming(url):
+    return properties['streaming']['enabled'] and not properties['cache']['enabled'] and url.endswith('.tar.gz')
+
+
+def _extract_archive(url, directory, extracted, useSudo=False):
+    archive = "%s/%s" % (properties['working_directory'], posixpath.basename(url))
+    streaming = _streaming(url) and not exists(archive)
+
+    if not streaming:
+        with cd(properties['working_directory']):
+            _wget(url, properties['proxy']['host'] is not None)
+        cmd = archives.extract_command("cat " + archive, directory, extracted,
+                                       artefacts.expected_sha256(_artefacts(), url))
+        if useSudo:
+            sudo(cmd)
+        else:
+            run(cmd)
+        run("rm -f %s" % archive)
+        return
+
+    # A stream cannot be resumed from another mirror, only the fastest one is used; its size is not known, the
+    # slot only counts in the connections of the proxy
+    with bandwidth.slot(env.host, _download_priority(url)) as slot:
+        wget = "wget"
+        if properties['proxy']['host'] is not None:
+            wget = wget + " -e use_proxy=yes -e http_proxy=$http_proxy"
+        source = "%s -qO- %s" % (_rate_limited(wget, slot), _mirror_urls(url)[0])
+        cmd = archives.extract_command(source, directory, extracted, artefacts.expected_sha256(_artefacts(), url))
+        if useSudo:
+            sudo(cmd)
+        else:
+            run(cmd)
+
+
+def _wget(url, useProxy=False, output=None, useSudo=False):
+    target = output or posixpath.basename(url)
+    prefetched = "%s/%s" % (properties['working_directory'], posixpath.basename(url))
+
+    # The file fetched by prefetch_artefacts is copied without holding a download slot
+    if _facts().exists(prefetched) or exists(prefetched):
+        cmd = "test -e %s || cp %s %s" % (target, prefetched, target)
+        if useSudo:
+            sudo(cmd)
+        else:
+            run(cmd)
+        return
+    if properties['cache']['enabled']:
+        put(_cached_artefact(url), target, use_sudo=useSudo)
+        return
+
+    mirror_urls = _mirror_urls(url)
+    size = _segmented_size(mirror_urls[0])
+    connections = properties['segmented']['segments'] if size is not None else 1
+    with bandwidth.slot(env.host, _download_priority(url), connections) as slot:
+        wget = "wget"
+        if useProxy:
+            wget = wget + " -e use_proxy=yes -e http_proxy=$http_proxy"
+        wget = _rate_limited(wget, slot)
+        # Mirrors are tried fastest first, each one resuming what the previous one downloaded; the file is renamed
+        # once complete, so that an interrupted download is never mistaken for the artefact
+        attempts = " || ".join("%s -c -O %s.part %s" % (wget, target, mirror_url) for mirror_url in mirror_urls)
+        cmd = "{ %s; } && mv %s.part %s" % (attempts, target, target)
+
+        # Large artefacts are first fetched in parallel segments, which a later run resumes after an interruption
+        if size is not None:
+            cmd = "{ %s; } || { %s; }" % (downloads.shell_command(mirror_urls[0], target, size,
+                                                             properties['segmented']['segments'], wget,
+                                                             artefacts.expected_sha256(_artefacts(), url)), cmd)
+
+        cmd = "{ %s; } && stat -c '@@downloaded %%s' %s" % (cmd, target)
+        if useSudo:
+            output = sudo(cmd)
+        else:
+            output = run(cmd)
+        slot.size = bandwidth.downloaded(output)
+
+
+def _rate_limited(wget, slot):
+    """wget command limited to the rate of each connection of a download slot"""
+    if slot.rate_kb_s is None:
+        return wget
+    return wget + " --limit-rate=%dk" % slot.rate_kb_s
+
+
+def _proxy_address(scheme='http'):
+    """URL of the proxy, with the credentials only when a username is configured"""
+    credentials = ""
+    if properties['proxy']['username'] is not None:
+        credentials = "%s:%s@" % (properties['proxy']['username'], properties['proxy']['pwd'] or '')
+    return "%s://%s%s:%s" % (scheme, credentials, properties['proxy']['host'], properties['proxy']['port'])
+
+
+def _proxies():
+    if properties['proxy']['host'] is None:
+        return None
+    proxy_addr = _proxy_address()
+    return {'http': proxy_addr, 'https': proxy_addr, 'ftp': proxy_addr}
+
+
+def _artefact_cache():
+    return artefact_cache.ArtefactCache(os.path.expanduser(properties['cache']['directory']),
+                                        properties['cache']['max_size_mb'] * 1024 * 1024,
+                                        properties['segmented']['threshold_mb'] * 1024 * 1024,
+                                        properties['segmented']['segments'])
+
+
+# Answer of the HEAD request of each URL, asked once per process, see _segmented_size
+_segmented_sizes = {}
+
+
+def _segmented_size(url):
+    """Size of url when it is large enough to be downloaded in segments, None otherwise"""
+    if properties['segmented']['segments'] <= 1:
+        return None
+    if url not in _segmented_sizes:
+        size, accepts_ranges = downloads.head(url, _proxies())
+        threshold = properties['segmented']['threshold_mb'] * 1024 * 1024
+        _segmented_sizes[url] = size if accepts_ranges and size is not None and size >= threshold else None
+    return _segmented_sizes[url]
+
+
+def _cached_artefact(url):
+    if dry_run.active():
+        return dry_run.controller_download(url, _artefact_cache().lookup(url))
+    sha256 = artefacts.expected_sha256(_artefacts(), url)
+    path = _artefact_cache().lookup(url, sha256)
+    if path is not None:
+        return path
+
+    connections = 1
+    if bandwidth.active() and _segmented_size(_mirror_urls(url)[0]) is not None:
+        connections = properties['segmented']['segments']
+    with bandwidth.slot(env.host or 'controller', _download_priority(url), connections) as slot:
+        path = _artefact_cache().fetch(url, sha256, _proxies(), sources=_mirror_urls(url),
+                                       rate=slot.rate_kb_s and slot.rate_kb_s * 1024)
+        slot.size = os.path.getsize(path)
+    return path
+
+
+def _download_priority(url):
+    """Priority of the running step, then of the installers of the artefact; steps out of the graph go first"""
+    consumers = [task_name for task_name, names in artefacts.TASK_ARTEFACTS.items()
+                 if any(_artefacts()[name].url == url for name in names)]
+    return (DOWNLOAD_PRIORITIES.get(telemetry.current_task(), max(DOWNLOAD_PRIORITIES.values()) + 1),
+            max([DOWNLOAD_PRIORITIES.get(task_name, 0) for task_name in consumers] or [0]))
+
+
+# Ranking of the mirrors, probed on the controller before the steps are forked, see probe_mirrors
+_mirror_ranking = None
+
+
+@task
+@timed_task
+def probe_mirrors():
+    for artefact in sorted(_artefacts().values()):
+        mirror_urls = _mirror_urls(artefact.url)
+        if len(mirror_urls) > 1:
+            logging.info('%s mirrors: %s' % (artefact.name, ', '.join(mirror_urls)))
+
+
+def _mirror_urls(url):
+    global _mirror_ranking
+    if _mirror_ranking is None:
+        _mirror_ranking = mirrors.MirrorRanking(
+            os.path.join(os.path.expanduser(properties['cache']['directory']), 'mirrors.json'),
+            properties['mirrors']['ttl_hours'] * 3600, properties['mirrors']['probe_kb'] * 1024, _proxies())
+    return _mirror_ranking.ordered(url, properties['mirrors']['groups'] or {})
+
+
+@task
+@timed_task
+def cache_hashes():
+    for artefact in sorted(_artefacts().values()):
+        path = _artefact_cache().lookup(artefact.url)
+        if path is not None:
+            logging.info('%s sha256: %s' % (artefact.name, os.path.basename(path)))
 
 
 @task
+@timed_task
 def edit_oh_my_zshrc():
     logging.info('Customize .zshrc file...')
 
-    with cd("$HOME"):
-        zshrc_file = ".zshrc"
-        run("cp ~/.oh-my-zsh/templates/zshrc.zsh-template ~/%s" % zshrc_file)
-        if properties['oh-my-zsh']['plugins'] is not None:
-            run("sed -i '/plugins=(/,/)/d' %s" % zshrc_file)
-            _append_to_file("plugins=(%s)" % properties['oh-my-zsh']['plugins'], zshrc_file)
-
-        # Add our own alias
-        # java
-        _append_to_file("# PATH\n", zshrc_file)
-        _append_to_file("# JAVA", zshrc_file)
-        java_path = "/usr/lib/jvm/java-%s-openjdk-amd64" % properties['java']['version']
-        text = "export JAVA_HOME=%s" % java_path
-        _append_to_file(text, zshrc_file)
-        _append_to_file("export PATH=##JAVA_HOME/bin:##PATH", zshrc_file)
-        run("echo 'export JAVA_OPTS=\"-Xms1024m -Xmx20000m\"' >> " + zshrc_file)
-
-        # maven
-        _append_to_file("# MAVEN", zshrc_file)
-        _append_to_file("export MAVEN_HOME=/opt/maven", zshrc_file)
-        _append_to_file("export PATH=##PATH:##MAVEN_HOME/bin", zshrc_file)
-        run("echo 'export MAVEN_OPTS=\"-Xmx1024m\"' >> " + zshrc_file)
-
-        # intellij
-        _append_to_file("# INTELLIJ", zshrc_file)
-        _append_to_file("export INTELLIJ_HOME=%s/intellij" % properties['working_directory'], zshrc_file)
-        _append_to_file("export PATH=##PATH:##INTELLIJ_HOME/bin", zshrc_file)
-
-        # tomcat
-        _append_to_file("# TOMCAT", zshrc_file)
-        _append_to_file("export CATALINA_HOME=%s/tomcat" % properties['working_directory'], zshrc_file)
-        run("echo 'export  CATALINA_OPTS=\"##CATALINA_OPTS -Xms256m\"' >> " + zshrc_file)
-
-        # liquibase
-        _append_to_file("# LIQUIBASE", zshrc_file)
-        _append_to_file("export LIQUIBASE_HOME=/opt/liquibase", zshrc_file)
-        _append_to_file("export PATH=##PATH:##LIQUIBASE_HOME", zshrc_file)
-
-        # ant
-        _append_to_file("# ANT", zshrc_file)
-        _append_to_file("export ANT_HOME=/opt/ant", zshrc_file)
-        _append_to_file("export PATH=##PATH:##ANT_HOME/bin", zshrc_file)
-
-        # proxy properties
-        if properties['proxy']['host'] is not None:
-            _append_to_file("# PROXY", zshrc_file)
-            proxy_addr = "http://%s:%s@%s:%s" % (
-                properties['proxy']['username'], properties['proxy']['pwd'], properties['proxy']['host'],
-                properties['proxy']['port'])
-            _append_to_file(
-                "no_proxy=localhost,127.0.0.1,172.16.0.0/12,10.0.0.0/8,*.site-mairie.noumea.nc,`/bin/hostname`",
-                zshrc_file)
-            _append_to_file("http_proxy=%s" % proxy_addr, zshrc_file)
-            _append_to_file("https_proxy=%s" % proxy_addr, zshrc_file)
-            _append_to_file("ftp_proxy=%s" % proxy_addr, zshrc_file)
-            _append_to_file("export http_proxy", zshrc_file)
-            _append_to_file("export https_proxy", zshrc_file)
-            _append_to_file("export ftp_proxy", zshrc_file)
-            _append_to_file("export no_proxy", zshrc_file)
-            _append_to_file("export HTTP_PROXY=##http_proxy", zshrc_file)
-            _append_to_file("export HTTPS_PROXY=##https_proxy", zshrc_file)
-            _append_to_file("export FTP_PROXY=##ftp_proxy", zshrc_file)
-
-        _append_to_file("# CUSTOM ALIAS", zshrc_file)
-        _append_to_file("alias ll='ls -ltr'", zshrc_file)
-        _append_to_file("alias squirrel='/opt/squirrel/squirrel-sql.sh'", zshrc_file)
-        _append_to_file(
-            "alias fakeSMTP='sudo java -jar %s/fakeSMTP/fakeSMTP-%s.jar -o . %s/fakeSMTP/received-emails  -a 127.0.0.1'" % (
-                properties['working_directory'], properties['fakeSMTP']['version'], properties['working_directory']),
-            zshrc_file)
-        _append_to_file("alias px='ps auxf | grep -v grep | grep -i -e VSZ -e'", zshrc_file)
-        _append_to_file("alias df='pydf'", zshrc_file)
-        _append_to_file("alias hist='history | grep'", zshrc_file)
-        _append_to_file("#Apache Directory Studio", zshrc_file)
-        _append_to_file("alias ads='%s/apacheDirectoryStudio/ApacheDirectoryStudio'" % properties['working_directory'],
-                       zshrc_file)
-        _append_to_file("#Datastudio", zshrc_file)
-        _append_to_file("alias datastudio='%s/DevTools/datastudio/datastudio.sh'" % properties['working_directory'],
-                       zshrc_file)
-        _append_to_file("#Intellij", zshrc_file)
-        _append_to_file("alias intellij='##INTELLIJ_HOME/bin/idea.sh'", zshrc_file)
-        _append_to_file("# BFG Repo-Cleaner", zshrc_file)
-        _append_to_file("alias bfg='java -jar %s/bfg-repo-cleaner/bfg.jar &&'" % properties['working_directory'],
-                       zshrc_file)
-
-        # _append_to_file("# Docker", zshrc_file)
-        # _append_to_file("# Kill all running containers.", zshrc_file)
-        # _append_to_file("alias dockerkillall='docker kill $(docker ps -q)'", zshrc_file)
-        # _append_to_file("# Delete all stopped containers.", zshrc_file)
-        # _append_to_file("alias dockercleanc='printf \"\n>>> Deleting stopped containers\n\n\" && docker rm $(docker ps -a -q)'", zshrc_file)
-        # _append_to_file("# Delete all untagged images.", zshrc_file)
-        # _append_to_file("alias dockercleani='printf \"\n>>> Deleting untagged images\n\n\" && docker rmi $(docker images -q -f dangling=true)'", zshrc_file)
-        # _append_to_file("# Delete all stopped containers and untagged images.", zshrc_file)
-        # _append_to_file("alias dockerclean='dockercleanc || true && dockercleani'", zshrc_file)
-        # _append_to_file("# Get image ip", zshrc_file)
-        # _append_to_file("alias dps=\"docker ps -q | xargs docker inspect --format '{{ .Id }} - {{ .Name }} - {{ .NetworkSettings.IPAddress }}'\"", zshrc_file)
-
-        run("sed -i 's/##/$/g' %s" % zshrc_file)
-
-        run("source ~/%s" % zshrc_file)
+    # The JVM options of .zshrc and IntelliJ are sized from the host's RAM and cores
+    _write_idea_vmoptions()
+    zshrc = _render_zshrc()
+    zshrc_file = ".zshrc"
+
+    # Upload only when the remote file differs from the rendered one
+    if _facts().sha256("~/.zshrc") == hashlib.sha256(zshrc.encode('utf-8')).hexdigest():
+        logging.info('.zshrc file already up to date...')
+        return
+
+    put(StringIO(zshrc), zshrc_file)
 
     logging.info('.zshrc file customized with success...')
+
+
+def _write_idea_vmoptions():
+    # Read by the IntelliJ launcher through IDEA_VM_OPTIONS, set in .zshrc
+    host_facts = _facts()
+    vmoptions = jvm_sizing.idea64_vmoptions(_jvm_profile(), host_facts.memory_kb, host_facts.cpus)
+    if host_facts.sha256(_idea_vmoptions_path()) != hashlib.sha256(vmoptions.encode('utf-8')).hexdigest():
+        put(StringIO(vmoptions), _idea_vmoptions_path())
+
+
+def _idea_vmoptions_path():
+    return "%s/idea64.vmoptions" % properties['working_directory']
+
+
+def _jvm_profile():
+    return jvm_sizing.profile(properties['jvm'], _facts().memory_kb)
+
+
+def _jvm_options(tool):
+    return " ".join(jvm_sizing.options(_jvm_profile(), tool, _facts().memory_kb, _facts().cpus))
+
+
+def _render_zshrc():
+    proxy = ""
+    if properties['proxy']['host'] is not None:
+        proxy_addr = _proxies()['http']
+        proxy = "\n".join([
+            "# PROXY",
+            "no_proxy=localhost,127.0.0.1,172.16.0.0/12,10.0.0.0/8,*.site-mairie.noumea.nc,`/bin/hostname`",
+            "http_proxy=%s" % proxy_addr,
+            "https_proxy=%s" % proxy_addr,
+            "ftp_proxy=%s" % proxy_addr,
+            "export http_proxy",
+            "export https_proxy",
+            "export ftp_proxy",
+            "export no_proxy",
+            "export HTTP_PROXY=$http_proxy",
+            "export HTTPS_PROXY=$https_proxy",
+            "export FTP_PROXY=$ftp_proxy",
+            ""])
+
+    with open("resources/zshrc.template", 'r') as template:
+        return template.read() % {
+            'plugins': properties['oh-my-zsh']['plugins'] or "git",
+            'java_home': "/usr/lib/jvm/java-%s-openjdk-amd64" % properties['java']['version'],
+            'working_directory': properties['working_directory'],
+            'fakesmtp_version': properties['fakeSMTP']['version'],
+            'proxy': proxy,
+            'java_opts': _jvm_options('java'),
+            'maven_opts': _jvm_options('maven'),
+            'catalina_opts': _jvm_options('tomcat'),
+            'idea_vmoptions': _idea_vmoptions_path(),
+            'maven_threads': properties['maven']['threads'],
+        }
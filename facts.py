@@ -0,0 +1,96 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import posixpath
+
+
+def gather_command(paths, hashed_files):
+    """Single remote command printing every fact, section by section"""
+    return '; '.join([
+        'echo @@codename',
+        '(. /etc/os-release 2>/dev/null && echo ${UBUNTU_CODENAME:-$VERSION_CODENAME})',
+        'echo @@home',
+        'echo $HOME',
+        'echo @@cpus',
+        'nproc',
+        'echo @@memory_kb',
+        "awk '/^MemTotal:/ {print $2}' /proc/meminfo",
+        'echo @@disk_free_kb',
+        "df -Pk $HOME | awk 'NR == 2 {print $4}'",
+        'echo @@packages',
+        "dpkg-query -W -f='${Package} ${Status} ${Version}\\n' 2>/dev/null",
+        'echo @@paths',
+        'for p in %s; do printf "%%s\\t%%s\\t%%s\\t%%s\\t%%s\\n" "$p" "$(test -e "$p" && echo 1 || echo 0)" '
+        '"$(readlink "$p")" "$(test -f "$p" && head -c 256 "$p" | head -n 1)" "$(stat -c %%s "$p" 2>/dev/null)"; '
+        'done' % ' '.join(paths),
+        'echo @@sha256',
+        'sha256sum %s 2>/dev/null' % ' '.join(hashed_files),
+        'true',
+    ])
+
+
+class HostFacts(object):
+    """Facts of a host, parsed from the output of gather_command"""
+
+    def __init__(self, output):
+        sections = {}
+        current = None
+        for line in output.splitlines():
+            line = line.rstrip('\r')
+            if line.startswith('@@'):
+                current = sections.setdefault(line[2:], [])
+            elif current is not None and line:
+                current.append(line)
+
+        self.codename = _first(sections, 'codename')
+        self.home = _first(sections, 'home')
+        self.cpus = int(_first(sections, 'cpus') or 1)
+        self.memory_kb = int(_first(sections, 'memory_kb') or 0)
+        self.disk_free_kb = int(_first(sections, 'disk_free_kb') or 0)
+
+        self.packages = {}
+        for line in sections.get('packages', []):
+            fields = line.split()
+            if len(fields) >= 5 and fields[3] == 'installed':
+                self.packages[fields[0]] = fields[4]
+
+        self.paths = {}
+        for line in sections.get('paths', []):
+            fields = (line.split('\t') + ['', '', '', ''])[:5]
+            self.paths[fields[0]] = {'exists': fields[1] == '1', 'link': fields[2] or None, 'content': fields[3],
+                                     'size': int(fields[4]) if fields[4].isdigit() else None}
+
+        self.hashes = {}
+        for line in sections.get('sha256', []):
+            digest, path = line.split(None, 1)
+            self.hashes[path] = digest
+
+    def _path(self, path):
+        if path.startswith('~') and self.home:
+            path = self.home + path[1:]
+        return self.paths.get(posixpath.normpath(path), {'exists': False, 'link': None, 'content': '', 'size': None})
+
+    def exists(self, path):
+        return self._path(path)['exists']
+
+    def link(self, path):
+        return self._path(path)['link']
+
+    def content(self, path):
+        return self._path(path)['content']
+
+    def size(self, path):
+        return self._path(path)['size']
+
+    def sha256(self, path):
+        if path.startswith('~') and self.home:
+            path = self.home + path[1:]
+        return self.hashes.get(path)
+
+    def set_exists(self, path):
+        self.paths.setdefault(posixpath.normpath(path), {'link': None, 'content': '', 'size': None})['exists'] = True
+
+
+def _first(sections, name):
+    lines = sections.get(name)
+    return lines[0].strip() if lines else None
@@ -0,0 +1,42 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+
+import probes
+
+
+def config_hash(properties, task_name):
+    """Hash of the configuration a step depends on, the whole configuration but the hosts for undeclared steps"""
+    if task_name in probes.CONFIG_SECTIONS:
+        return probes.config_hash(properties, task_name)
+    sections = dict((key, value) for key, value in properties.items() if key not in ('hosts', 'user'))
+    return hashlib.sha1(json.dumps(sections, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class Journal(object):
+    """Workflow steps completed on a host, each with the hash of the configuration it was run with, as JSON lines"""
+
+    def __init__(self, path):
+        self.path = path
+        self._completed = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._completed[entry['task']] = entry['config_hash']
+
+    def completed(self, task_name, config_hash):
+        return self._completed.get(task_name) == config_hash
+
+    def record(self, task_name, config_hash):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'task': task_name, 'config_hash': config_hash, 'completed_at': time.time()}) + '\n')
+        self._completed[task_name] = config_hash
@@ -0,0 +1,43 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+# Heaps are multiples of this size, in MB
+HEAP_ROUNDING_MB = 64
+
+# Options of the IntelliJ launcher kept whatever the sizing, see idea64_vmoptions()
+IDEA_OPTIONS = [
+    '-XX:ReservedCodeCacheSize=240m',
+    '-XX:SoftRefLRUPolicyMSPerMB=50',
+    '-ea',
+    '-Dsun.io.useCanonCaches=false',
+    '-Djava.net.preferIPv4Stack=true',
+    '-XX:+HeapDumpOnOutOfMemoryError',
+    '-XX:-OmitStackTraceInFastThrow',
+]
+
+
+def profile(jvm, memory_kb):
+    """Configured profile, or with auto the one with the largest min_memory_mb the host has"""
+    if jvm['profile'] != 'auto':
+        return jvm['profiles'][jvm['profile']]
+    eligible = [settings for settings in jvm['profiles'].values() if settings['min_memory_mb'] * 1024 <= memory_kb]
+    return max(eligible or jvm['profiles'].values(), key=lambda settings: settings['min_memory_mb'])
+
+
+def heap_mb(memory_kb, ratio, minimum, maximum):
+    heap = int(memory_kb / 1024 * ratio) // HEAP_ROUNDING_MB * HEAP_ROUNDING_MB
+    return max(minimum, min(maximum, heap))
+
+
+def options(settings, tool, memory_kb, cpus):
+    """JVM options of a tool: its heap a share of the host's RAM, the garbage collector threads a share of its cores"""
+    sizing = settings['tools'][tool]
+    heap = heap_mb(memory_kb, sizing['heap_ratio'], sizing['min_heap_mb'], sizing['max_heap_mb'])
+    initial = max(HEAP_ROUNDING_MB, int(heap * settings['initial_heap_ratio']) // HEAP_ROUNDING_MB * HEAP_ROUNDING_MB)
+    return ['-Xms%dm' % initial, '-Xmx%dm' % heap, '-XX:+Use%s' % settings['gc'],
+            '-XX:ParallelGCThreads=%d' % max(1, int(cpus * settings['gc_threads_ratio']))]
+
+
+def idea64_vmoptions(settings, memory_kb, cpus):
+    """Content of an idea64.vmoptions file, which replaces the one of the IntelliJ distribution"""
+    return '\n'.join(options(settings, 'intellij', memory_kb, cpus) + IDEA_OPTIONS) + '\n'
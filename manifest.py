@@ -0,0 +1,267 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import sys
+import hashlib
+import tempfile
+import cPickle
+import collections
+
+import yaml
+from fabric.utils import abort
+
+import artefacts
+
+# Compiled configurations, one pickle per content of the YAML file and version of the compiling modules
+CACHE_DIRECTORY = 'logs/manifest'
+
+TEXT = (str, unicode)
+NUMBER = (int, long, float)
+# Versions read by YAML as numbers, e.g. 9.4, as well as strings, e.g. 3.5.2
+VERSION = TEXT + NUMBER
+FLAG = (bool,)
+LIST = (list,)
+SECTION = (dict,)
+
+
+class Optional(object):
+    """Value of the given types, or left empty"""
+
+    def __init__(self, types):
+        self.types = types
+
+
+# Types of the keys of install_conf.yaml read by the tasks, * standing for any key of a section
+SCHEMA = {
+    'hosts': Optional(LIST + TEXT),
+    'user': TEXT,
+    'working_directory': TEXT,
+    'proxy/host': Optional(TEXT),
+    'proxy/port': Optional(NUMBER + TEXT),
+    'proxy/username': Optional(TEXT),
+    'proxy/pwd': Optional(TEXT + NUMBER),
+    'apt/repository': Optional(TEXT),
+    'apt/bundle/directory': TEXT,
+    'apt/bundle/push': FLAG,
+    'prefetch/workers': NUMBER,
+    'cache/enabled': FLAG,
+    'cache/directory': TEXT,
+    'cache/max_size_mb': NUMBER,
+    'mirrors/ttl_hours': NUMBER,
+    'mirrors/probe_kb': NUMBER,
+    'mirrors/groups': Optional(SECTION),
+    'mirrors/groups/*': LIST,
+    'segmented/threshold_mb': NUMBER,
+    'segmented/segments': NUMBER,
+    'streaming/enabled': FLAG,
+    'scheduler/workers': NUMBER,
+    'scheduler/locks/*': NUMBER,
+    'remote_shell/enabled': FLAG,
+    'journal/directory': TEXT,
+    'output/directory': TEXT,
+    'output/verbose': FLAG,
+    'telemetry/directory': TEXT,
+    'telemetry/slowest': NUMBER,
+    'plan/command_overhead_s': NUMBER,
+    'plan/bandwidth_kb_s': NUMBER,
+    'distribution/enabled': FLAG,
+    'distribution/fanout': NUMBER,
+    'distribution/accept_unknown_host_keys': FLAG,
+    'fleet/pool_size': NUMBER,
+    'fleet/log_directory': TEXT,
+    'bandwidth/enabled': FLAG,
+    'bandwidth/max_connections': NUMBER,
+    'bandwidth/budget_kb_s': NUMBER,
+    'java/version': VERSION,
+    'jvm/profile': TEXT,
+    'jvm/profiles/*/min_memory_mb': NUMBER,
+    'jvm/profiles/*/gc': TEXT,
+    'jvm/profiles/*/gc_threads_ratio': NUMBER,
+    'jvm/profiles/*/initial_heap_ratio': NUMBER,
+    'jvm/profiles/*/tools/*/heap_ratio': NUMBER,
+    'jvm/profiles/*/tools/*/min_heap_mb': NUMBER,
+    'jvm/profiles/*/tools/*/max_heap_mb': NUMBER,
+    'maven/url': TEXT,
+    'maven/artefact': TEXT,
+    'maven/version': VERSION,
+    'maven/sha256': Optional(TEXT),
+    'maven/mirror_url': Optional(TEXT),
+    'maven/seed_archive': Optional(TEXT),
+    'maven/threads': VERSION,
+    'ant/url': TEXT,
+    'ant/artefact': TEXT,
+    'ant/version': VERSION,
+    'liquibase/url': TEXT,
+    'liquibase/version': VERSION,
+    'driver/postgres.url': TEXT,
+    'driver/postgres.version': VERSION,
+    'driver/h2.url': TEXT,
+    'driver/h2.version': VERSION,
+    'driver/jt400.url': TEXT,
+    'driver/jt400.version': VERSION,
+    'schemacrawler/url': TEXT,
+    'schemacrawler/version': VERSION,
+    'intellij/url': TEXT,
+    'intellij/version': VERSION,
+    'intellij/build': TEXT,
+    'intellij/artefact': TEXT,
+    'oh-my-zsh/repository': TEXT,
+    'oh-my-zsh/plugins': Optional(TEXT),
+    'bfg_cleaner/url': TEXT,
+    'bfg_cleaner/version': VERSION,
+    'fakeSMTP/url': TEXT,
+    'fakeSMTP/version': VERSION,
+    'ads/url': TEXT,
+    'ads/artefact': TEXT,
+    'ads/version': VERSION,
+    'tomcat/url': TEXT,
+    'tomcat/major': TEXT,
+    'tomcat/artefact': TEXT,
+    'tomcat/version': VERSION,
+    'javax.mail/url': TEXT,
+    'javax.mail/version': VERSION,
+    'activation/url': TEXT,
+    'activation/version': VERSION,
+    'postgres/version': VERSION,
+    'postgres/pwd': TEXT + NUMBER,
+    'postgres/tuning/enabled': FLAG,
+    'postgres/tuning/shared_buffers_ratio': NUMBER,
+    'postgres/tuning/effective_cache_size_ratio': NUMBER,
+    'postgres/tuning/work_mem_ratio': NUMBER,
+    'postgres/tuning/work_mem_connections': NUMBER,
+    'postgres/tuning/max_wal_size_mb': NUMBER,
+    'postgres/tuning/random_page_cost': NUMBER,
+    'postgres/tuning/fsync': FLAG,
+    'postgres/tuning/pgbench/scale': NUMBER,
+    'postgres/tuning/pgbench/clients': NUMBER,
+    'postgres/tuning/pgbench/seconds': NUMBER,
+    'datagrip/url': TEXT,
+    'datagrip/version': VERSION,
+    'datagrip/artefact': TEXT,
+}
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _values(document, keys, path=''):
+    # (path, value) of the keys of the document, a missing key giving a None value
+    if not keys:
+        yield path, document
+        return
+    if not isinstance(document, dict):
+        raise ManifestError('%s: a section is expected, not %r' % (path, document))
+    key, rest = keys[0], keys[1:]
+    names = sorted(document) if key == '*' else [key]
+    for name in names:
+        for value in _values(document.get(name), rest, '%s/%s' % (path, name) if path else name):
+            yield value
+
+
+def _matches(value, types):
+    # bool being an int, flags are only accepted where a flag is expected
+    if isinstance(value, bool):
+        return types == FLAG
+    return isinstance(value, types)
+
+
+def validate(properties):
+    """Check the configuration against SCHEMA, raising a ManifestError naming the first wrong key"""
+    for key, types in sorted(SCHEMA.items()):
+        optional = isinstance(types, Optional)
+        if optional:
+            types = types.types
+        for path, value in _values(properties, key.split('/')):
+            if value is None and not optional:
+                raise ManifestError('%s is missing' % path)
+            if value is not None and not _matches(value, types):
+                raise ManifestError('%s: %r is not of the expected type' % (path, value))
+
+
+def compile_properties(content):
+    """Configuration of the YAML content once validated, with the resolved artefacts"""
+    properties = yaml.safe_load(content)
+    if not isinstance(properties, dict):
+        raise ManifestError('the configuration is not a YAML mapping')
+    validate(properties)
+    try:
+        resolved = artefacts.resolve(properties)
+    except (TypeError, ValueError, KeyError) as e:
+        # Templates not matching their values, e.g. one %s for a version used twice
+        raise ManifestError('artefact URL templates: %s' % e)
+    return properties, resolved
+
+
+def _source_mtime(module):
+    path = module.__file__
+    if path.endswith(('.pyc', '.pyo')) and os.path.exists(path[:-1]):
+        path = path[:-1]
+    return os.path.getmtime(path)
+
+
+def cached(path, compile_function, cache_directory=CACHE_DIRECTORY):
+    """Result of compile_function on the content of path, from the cache while neither of them changes"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    module = sys.modules[compile_function.__module__]
+    key = hashlib.sha1('%s\0%s\0%r\0%r' % (compile_function.__name__, content, _source_mtime(module),
+                                           _source_mtime(artefacts))).hexdigest()
+    cache_path = os.path.join(cache_directory, '%s.pickle' % key)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                return cPickle.load(f)
+        except Exception:
+            # Written by another version of Python or truncated, compiled again
+            pass
+
+    compiled = compile_function(content)
+    if not os.path.isdir(cache_directory):
+        os.makedirs(cache_directory)
+    # Written aside then renamed, so that runs started at the same time never read a partial file
+    handle, partial = tempfile.mkstemp(dir=cache_directory, suffix='.partial')
+    with os.fdopen(handle, 'wb') as f:
+        cPickle.dump(compiled, f, 2)
+    os.rename(partial, cache_path)
+    return compiled
+
+
+class Manifest(collections.Mapping):
+    """Configuration loaded on first access, compiled once per content of its YAML file
+
+    A configuration error aborts the run at that first access, before any remote command.
+    """
+
+    def __init__(self, path, on_load=None, cache_directory=CACHE_DIRECTORY):
+        self.path = path
+        self.on_load = on_load
+        self.cache_directory = cache_directory
+        self._properties = None
+        self._artefacts = None
+
+    def _load(self):
+        if self._properties is None:
+            try:
+                self._properties, self._artefacts = cached(self.path, compile_properties, self.cache_directory)
+            except ManifestError as e:
+                abort('Invalid configuration %s: %s' % (self.path, e))
+            if self.on_load is not None:
+                self.on_load(self)
+        return self._properties
+
+    @property
+    def artefacts(self):
+        """Artefacts of the configuration by name, with their URL, file name and install path resolved"""
+        self._load()
+        return self._artefacts
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
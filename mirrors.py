@@ -0,0 +1,85 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import logging
+import tempfile
+
+try:
+    from urllib2 import build_opener, ProxyHandler, Request
+except ImportError:
+    from urllib.request import build_opener, ProxyHandler, Request
+
+PROBE_TIMEOUT = 10
+
+
+def candidates(url, groups):
+    """(mirror, URL) pairs serving url: url itself, then url on every other mirror of its group"""
+    for mirrors in groups.values():
+        for mirror in mirrors:
+            base = mirror.rstrip('/') + '/'
+            if url.startswith(base):
+                path = url[len(base):]
+                return [(mirror, url)] + [(other, other.rstrip('/') + '/' + path)
+                                          for other in mirrors if other != mirror]
+    return [(None, url)]
+
+
+class MirrorRanking(object):
+    """Download time of a small range of an artefact from each mirror, kept on disk for ttl seconds"""
+
+    def __init__(self, path, ttl, probe_bytes, proxies=None):
+        self.path = path
+        self.ttl = ttl
+        self.probe_bytes = probe_bytes
+        self.proxies = proxies
+        self._scores = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self._scores = json.load(f)
+
+    def ordered(self, url, groups):
+        """URLs serving url, the fastest mirror first and unreachable mirrors last"""
+        pairs = candidates(url, groups)
+        if len(pairs) == 1:
+            return [url]
+        scores = dict((mirror, self.score(mirror, candidate)) for mirror, candidate in pairs)
+        reachable = sorted([pair for pair in pairs if scores[pair[0]] is not None], key=lambda pair: scores[pair[0]])
+        return [candidate for _, candidate in reachable] + \
+               [candidate for mirror, candidate in pairs if scores[mirror] is None]
+
+    def score(self, mirror, url):
+        """Seconds to fetch probe_bytes of url from mirror, None when it cannot be reached"""
+        entry = self._scores.get(mirror)
+        if entry is None or time.time() - entry['probed_at'] > self.ttl:
+            entry = {'seconds': self._probe(url), 'probed_at': time.time()}
+            self._scores[mirror] = entry
+            self._save()
+        return entry['seconds']
+
+    def _probe(self, url):
+        request = Request(url, headers={'Range': 'bytes=0-%d' % (self.probe_bytes - 1)})
+        start = time.time()
+        try:
+            response = build_opener(ProxyHandler(self.proxies or {})).open(request, timeout=PROBE_TIMEOUT)
+            try:
+                size = len(response.read(self.probe_bytes))
+            finally:
+                response.close()
+        except Exception as e:
+            logging.warning('Mirror probe of %s failed: %s' % (url, e))
+            return None
+        seconds = time.time() - start
+        logging.info('Mirror probe of %s: %d bytes in %.2fs' % (url, size, seconds))
+        return seconds
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, path = tempfile.mkstemp(dir=directory, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._scores, f, indent=2, sort_keys=True)
+        os.rename(path, self.path)
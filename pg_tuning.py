@@ -0,0 +1,77 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import re
+
+# Written into the conf.d directory of the cluster, loaded after postgresql.conf
+CONF_FILE = '90-dev-performance.conf'
+BENCH_DATABASE = 'pgbench_dev'
+
+_TPS = re.compile(r'^tps = ([0-9.]+) \((excluding|without)', re.MULTILINE)
+
+
+def _version(version):
+    return tuple(int(part) for part in str(version).split('.'))
+
+
+def settings(tuning, version, memory_kb, cpus):
+    """(name, value) pairs of a developer profile sized from the host, only those the PostgreSQL version knows"""
+    memory_mb = memory_kb // 1024
+    shared_buffers = max(128, min(8192, int(memory_mb * tuning['shared_buffers_ratio'])))
+    pairs = [
+        ('shared_buffers', '%dMB' % shared_buffers),
+        ('effective_cache_size', '%dMB' % max(512, int(memory_mb * tuning['effective_cache_size_ratio']))),
+        # Shared by the connections, each sort or hash of a query being allowed this much
+        ('work_mem', '%dMB' % max(4, int(memory_mb * tuning['work_mem_ratio'] / tuning['work_mem_connections']))),
+        ('maintenance_work_mem', '%dMB' % max(64, min(2048, memory_mb // 16))),
+        ('checkpoint_completion_target', '0.9'),
+        ('random_page_cost', str(tuning['random_page_cost'])),
+        ('max_worker_processes', str(max(8, cpus))),
+    ]
+    if _version(version) >= (9, 5):
+        pairs.append(('max_wal_size', '%dMB' % tuning['max_wal_size_mb']))
+    else:
+        # WAL segments of 16 MB, up to about three times checkpoint_segments between checkpoints
+        pairs.append(('checkpoint_segments', str(max(3, tuning['max_wal_size_mb'] // 48))))
+    if _version(version) >= (9, 6):
+        pairs.append(('max_parallel_workers_per_gather', str(max(1, min(4, cpus // 2)))))
+    if _version(version) >= (10,):
+        pairs.append(('max_parallel_workers', str(cpus)))
+
+    # Durability traded for speed: a crash loses the last transactions, or with fsync off the whole cluster
+    pairs.append(('synchronous_commit', 'off'))
+    if not tuning['fsync']:
+        pairs.extend([('fsync', 'off'), ('full_page_writes', 'off')])
+    return pairs
+
+
+def conf(pairs):
+    return '# Generated by dev-workstation-installer (postgresql_tune task), local changes are overwritten\n' + \
+           ''.join("%s = '%s'\n" % pair for pair in pairs)
+
+
+def pgbench_path(version):
+    return '/usr/lib/postgresql/%s/bin/pgbench' % version
+
+
+def contrib_package(version):
+    """Package providing pgbench, part of the server package since PostgreSQL 10"""
+    return None if _version(version) >= (10,) else 'postgresql-contrib-%s' % version
+
+
+def bench_command(version, bench):
+    """Command run as postgres, printing the transactions per second of the bench database"""
+    return '%s -c %d -j %d -T %d %s' % (pgbench_path(version), bench['clients'], bench['clients'], bench['seconds'],
+                                        BENCH_DATABASE)
+
+
+def init_command(version, bench):
+    """Command run as postgres, creating the bench database anew"""
+    return 'dropdb --if-exists %s && createdb %s && %s -i -q -s %d %s' % (
+        BENCH_DATABASE, BENCH_DATABASE, pgbench_path(version), bench['scale'], BENCH_DATABASE)
+
+
+def tps(output):
+    """Transactions per second reported by pgbench, None when it did not report any"""
+    match = _TPS.search(output)
+    return float(match.group(1)) if match else None
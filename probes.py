@@ -0,0 +1,68 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import json
+import hashlib
+from collections import namedtuple
+
+# Host fact ('link' target or first line of 'content') equal to 'expected' when the task has nothing to do
+Probe = namedtuple('Probe', ['path', 'attribute', 'expected'])
+
+# Configuration sections each task depends on, shared jars aside: they are relinked on every run
+CONFIG_SECTIONS = {
+    'maven_install': ['maven'],
+    'ant_install': ['ant'],
+    'liquibase_install': ['liquibase'],
+    'schemacrawler_install': ['schemacrawler'],
+    'intellij_install': ['intellij'],
+    'datagrip_install': ['datagrip'],
+    'apache_directory_studio_install': ['ads'],
+    'apache_tomcat_install': ['tomcat'],
+    'bfg_repo_cleaner_install': ['bfg_cleaner'],
+    'fakeSMTP_install': ['fakeSMTP'],
+}
+
+
+def config_hash(properties, task_name):
+    """Hash of the configuration sections the task depends on"""
+    sections = dict((section, properties.get(section)) for section in CONFIG_SECTIONS.get(task_name, []))
+    return hashlib.sha1(json.dumps(sections, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def marker_path(properties, task_name):
+    return '%s/.installed/%s' % (properties['working_directory'], task_name)
+
+
+def _symlinks(properties):
+    # Tasks whose installed version shows in the target of the symlink they create
+    working_directory = properties['working_directory']
+    return {
+        'maven_install': ('/opt/maven', '/opt/apache-maven-%s' % properties['maven']['version']),
+        'ant_install': ('/opt/ant', '/opt/apache-ant-%s' % properties['ant']['version']),
+        'intellij_install': ('%s/intellij' % working_directory, properties['intellij']['build']),
+        'datagrip_install': ('%s/datagrip' % working_directory, 'DataGrip-%s' % properties['datagrip']['version']),
+    }
+
+
+def probe(properties, task_name):
+    """Probe telling whether the host already matches the configuration of the task"""
+    symlinks = _symlinks(properties)
+    if task_name in symlinks:
+        path, target = symlinks[task_name]
+        return Probe(path, 'link', target)
+    return Probe(marker_path(properties, task_name), 'content', config_hash(properties, task_name))
+
+
+def is_current(probe, host_facts):
+    if probe.attribute == 'link':
+        return host_facts.link(probe.path) == probe.expected
+    return host_facts.content(probe.path) == probe.expected
+
+
+def paths(properties):
+    """Paths of every probe, to be gathered with the host facts"""
+    return [probe(properties, task_name).path for task_name in sorted(CONFIG_SECTIONS)]
+
+
+def uses_marker(properties, task_name):
+    return task_name not in _symlinks(properties)
@@ -0,0 +1,198 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import uuid
+import base64
+import socket
+import logging
+import functools
+
+from fabric.state import env, output, connections
+from fabric.context_managers import quiet as quiet_manager, warn_only as warn_only_manager
+from fabric.operations import _AttributeString, _prefix_commands, _prefix_env_vars
+from fabric.utils import error
+
+SUDO_PROMPT = '@@sudo-password@@'
+START_TIMEOUT = 30
+CHUNK_SIZE = 32768
+# Keyword arguments of run and sudo honoured by the shells, other calls are executed by Fabric itself
+SUPPORTED_ARGUMENTS = ('quiet', 'warn_only')
+
+# Shells of this process by (host string, privileged), False for the hosts where one could not be opened
+_shells = {}
+_enabled = False
+
+
+class ShellError(Exception):
+    pass
+
+
+def configure(enabled):
+    global _enabled
+    _enabled = enabled
+
+
+class RemoteShell(object):
+    """Login shell kept open on a host, running commands one at a time, their end framed by a marker line
+
+    Each command runs in a subshell with stdin from /dev/null and stderr merged into stdout, so that it can neither
+    read the following commands nor change the state of the shell.
+    """
+
+    def __init__(self, channel, marker):
+        self.channel = channel
+        self.marker = marker
+        self.pid = os.getpid()
+        self._buffer = ''
+
+    @classmethod
+    def open(cls, channel, privileged, password=None):
+        """Start the shell on an SSH channel, as root with sudo when privileged, None when sudo needs a password"""
+        shell = cls(channel, '@@%s' % uuid.uuid4().hex)
+        channel.set_combine_stderr(True)
+        channel.settimeout(START_TIMEOUT)
+        if privileged:
+            # Nothing is written before sudo asks for its password or the shell is started, it would be read as one
+            channel.exec_command("sudo -S -p '%s' /bin/bash -c 'echo %s; exec /bin/bash -l'" % (
+                SUDO_PROMPT, shell.marker))
+            if shell._read_until(SUDO_PROMPT, shell.marker + '\n') == SUDO_PROMPT:
+                if password is None:
+                    channel.close()
+                    return None
+                channel.sendall(password + '\n')
+                if shell._read_until(SUDO_PROMPT, shell.marker + '\n') == SUDO_PROMPT:
+                    channel.close()
+                    raise ShellError('sudo password rejected')
+        else:
+            channel.exec_command('/bin/bash -l')
+        # Whatever the profile prints comes before this marker
+        channel.sendall('echo %s\n' % shell.marker)
+        shell._read_until(shell.marker + '\n')
+        channel.settimeout(None)
+        return shell
+
+    def execute(self, command, echo=None):
+        """Output and exit code of command, each line of output given to echo as it arrives"""
+        self.channel.sendall('( eval "$(echo %s | base64 -d)" ) < /dev/null 2>&1; printf "\\n%s %%d\\n" $?\n' % (
+            base64.b64encode(command), self.marker))
+        lines = []
+        while True:
+            line = self._read_line()
+            if line.startswith(self.marker + ' '):
+                break
+            # Echoed one line late, the line before the marker being empty unless the output lacks a final newline
+            if lines and echo is not None:
+                echo(lines[-1])
+            lines.append(line)
+        if lines and lines[-1] and echo is not None:
+            echo(lines[-1])
+        return '\n'.join(lines).strip(), int(line.split()[1])
+
+    def close(self):
+        self.channel.close()
+
+    def _read_line(self):
+        self._read_until('\n')
+        line, self._buffer = self._buffer.split('\n', 1)
+        return line.rstrip('\r')
+
+    def _read_until(self, *terminators):
+        """First terminator found in the output, everything up to its end being consumed except for '\n'"""
+        while True:
+            found = [(self._buffer.find(terminator), terminator) for terminator in terminators
+                     if terminator in self._buffer]
+            if found:
+                index, terminator = min(found)
+                if terminator != '\n':
+                    self._buffer = self._buffer[index + len(terminator):]
+                return terminator
+            chunk = self.channel.recv(CHUNK_SIZE)
+            if not chunk:
+                raise ShellError('shell closed')
+            self._buffer += chunk
+
+
+def persistent(operation, privileged):
+    """Wrap Fabric run (or sudo when privileged) so that commands go through a shell kept open on the host
+
+    Calls with arguments the shells do not support, and every call on a host where no shell could be opened, are
+    executed by operation.
+    """
+    which = 'sudo' if privileged else 'run'
+
+    @functools.wraps(operation)
+    def wrapper(*args, **kwargs):
+        command = kwargs.get('command', args[0] if args else None)
+        if not _enabled or env.host_string is None or len(args) > 1 or \
+                [name for name in kwargs if name not in SUPPORTED_ARGUMENTS + ('command',)] or \
+                (not privileged and 'sudo' in command):
+            # Without a terminal, sudo can not ask for the password from the user shell
+            return operation(*args, **kwargs)
+        shell = _shell(privileged)
+        if shell is None:
+            return operation(*args, **kwargs)
+
+        manager = quiet_manager if kwargs.get('quiet') else warn_only_manager if kwargs.get('warn_only') else None
+        if manager is None:
+            return _execute(shell, which, command)
+        with manager():
+            return _execute(shell, which, command)
+
+    return wrapper
+
+
+def _execute(shell, which, command):
+    wrapped_command = _prefix_env_vars(_prefix_commands(command, 'remote'))
+    if output.debug:
+        print("[%s] %s: %s" % (env.host_string, which, wrapped_command))
+    elif output.running:
+        print("[%s] %s: %s" % (env.host_string, which, command))
+
+    def echo(line):
+        if output.stdout:
+            print("[%s] out: %s" % (env.host_string, line))
+
+    try:
+        stdout, status = shell.execute(wrapped_command, echo)
+    except (ShellError, socket.error) as e:
+        # The command may have run, it is not executed again
+        _shells[(env.host_string, which == 'sudo')] = False
+        stdout, status = 'Persistent shell failed: %s' % e, -1
+
+    out = _AttributeString(stdout)
+    out.failed = status not in env.ok_ret_codes
+    out.command = command
+    out.real_command = wrapped_command
+    out.return_code = status
+    out.succeeded = not out.failed
+    out.stderr = _AttributeString('')
+    if out.failed:
+        message = "%s() received nonzero return code %s while executing" % (which, status)
+        if env.warn_only:
+            message += " '%s'!" % command
+        else:
+            message += "!\n\nRequested: %s\nExecuted: %s" % (command, wrapped_command)
+        error(message=message, stdout=out)
+    return out
+
+
+def _shell(privileged):
+    """Shell of this process on the current host, opened on first use"""
+    key = (env.host_string, privileged)
+    shell = _shells.get(key)
+    if shell and shell.pid != os.getpid():
+        # Inherited from the parent process, whose connection the channel belongs to
+        shell = None
+    if shell is None:
+        password = env.get('sudo_password') or env.passwords.get(env.host_string) or env.password
+        try:
+            shell = RemoteShell.open(connections[env.host_string].get_transport().open_session(), privileged, password)
+        except Exception as e:
+            logging.warning('No persistent shell on %s, commands run one SSH session each: %s' % (env.host_string, e))
+            shell = False
+        if shell is None:
+            # Fabric asks for the sudo password, the next command opens the shell with it
+            return None
+        _shells[key] = shell
+    return shell or None
@@ -0,0 +1,132 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import time
+import logging
+import multiprocessing
+from collections import namedtuple
+
+POLL_INTERVAL = 0.2
+
+TaskResult = namedtuple('TaskResult', ['name', 'status', 'start', 'end'])
+
+
+class SchedulerError(Exception):
+    pass
+
+
+def run(nodes, graph, capacities, workers, child_init=None):
+    """Run (name, callable) nodes in child processes, as soon as their dependencies are done and their locks free
+
+    graph maps a task name to {'after': [task names], 'locks': [lock names]}; dependencies which are not part of
+    nodes are ignored. capacities maps a lock name to the number of tasks which may hold it at the same time.
+    """
+    names = [name for name, _ in nodes]
+    callables = dict(nodes)
+    dependencies = dict((name, [dep for dep in graph.get(name, {}).get('after', []) if dep in callables])
+                        for name in names)
+    locks = dict((name, graph.get(name, {}).get('locks', [])) for name in names)
+    _check_cycles(names, dependencies)
+    _check_capacities(capacities, workers)
+
+    pending = list(names)
+    running = {}
+    held = dict((lock, 0) for lock in capacities)
+    results = {}
+
+    while pending or running:
+        for name, process in list(running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            status = 'success' if process.exitcode == 0 else 'failed'
+            results[name] = TaskResult(name, status, results[name].start, time.time())
+            for lock in locks[name]:
+                held[lock] -= 1
+            del running[name]
+            logging.info('%s %s in %.1fs' % (name, status, results[name].end - results[name].start))
+
+        for name in list(pending):
+            failed_dependencies = [dep for dep in dependencies[name]
+                                   if dep in results and results[dep].status in ('failed', 'skipped')]
+            if failed_dependencies:
+                now = time.time()
+                results[name] = TaskResult(name, 'skipped', now, now)
+                pending.remove(name)
+                logging.error('%s skipped, %s did not succeed' % (name, ', '.join(failed_dependencies)))
+                continue
+            if len(running) >= workers:
+                break
+            if not all(dep in results and results[dep].status == 'success' for dep in dependencies[name]):
+                continue
+            if not all(held.get(lock, 0) < capacities.get(lock, 1) for lock in locks[name]):
+                continue
+
+            for lock in locks[name]:
+                held[lock] = held.get(lock, 0) + 1
+            process = multiprocessing.Process(target=_run_child, args=(callables[name], child_init), name=name)
+            results[name] = TaskResult(name, 'running', time.time(), None)
+            process.start()
+            running[name] = process
+            pending.remove(name)
+
+        if running:
+            time.sleep(POLL_INTERVAL)
+        elif pending:
+            raise SchedulerError('No step can start: %s' % ', '.join(pending))
+
+    return [results[name] for name in names]
+
+
+def critical_path(results, graph):
+    """Chain of tasks ending with the last finished one, following the dependency which finished last"""
+    by_name = dict((result.name, result) for result in results)
+    path = []
+    current = max(results, key=lambda result: result.end) if results else None
+    while current is not None:
+        path.insert(0, current)
+        previous = [by_name[dep] for dep in graph.get(current.name, {}).get('after', []) if dep in by_name]
+        current = max(previous, key=lambda result: result.end) if previous else None
+    return path
+
+
+def log_summary(results, graph):
+    path = critical_path(results, graph)
+    if not path:
+        return
+    logging.info('Critical path (%.1fs): %s' % (
+        path[-1].end - path[0].start,
+        ' -> '.join('%s (%.1fs)' % (result.name, result.end - result.start) for result in path)))
+
+
+def _run_child(target, child_init):
+    if child_init is not None:
+        child_init()
+    target()
+
+
+def _check_capacities(capacities, workers):
+    if workers < 1:
+        raise SchedulerError('At least one worker is needed, not %s' % workers)
+    for lock, capacity in sorted(capacities.items()):
+        if capacity < 1:
+            raise SchedulerError('Capacity of lock %s must be at least 1, not %s' % (lock, capacity))
+
+
+def _check_cycles(names, dependencies):
+    visiting = set()
+    done = set()
+
+    def visit(name, chain):
+        if name in done:
+            return
+        if name in visiting:
+            raise SchedulerError('Dependency cycle: %s' % ' -> '.join(chain + [name]))
+        visiting.add(name)
+        for dep in dependencies[name]:
+            visit(dep, chain + [name])
+        visiting.remove(name)
+        done.add(name)
+
+    for name in names:
+        visit(name, [])
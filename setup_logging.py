@@ -6,9 +6,34 @@ import logging.config
 
 import yaml
 
+import background
+
+
+class QueueHandler(logging.Handler):
+    """Hand records over to handlers run by a background thread, so that logging does not wait for file writes"""
+
+    def __init__(self, handlers):
+        logging.Handler.__init__(self)
+        self.handlers = handlers
+        self.worker = background.Worker(self._handle)
+
+    def emit(self, record):
+        # Formatted now, the arguments and traceback may not be the same once the thread gets to the record
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.worker.put(record)
+
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
 
 def setup_logging(default_path='./resources/logging_conf.yaml', default_level=logging.INFO, env_key='LOG_CFG'):
-    """Setup logging configuration"""
+    """Setup logging configuration, the file handlers of the root logger being run in the background"""
     path = default_path
     value = os.getenv(env_key, None)
     if value:
@@ -19,3 +44,10 @@ def setup_logging(default_path='./resources/logging_conf.yaml', default_level=lo
         logging.config.dictConfig(config)
     else:
         logging.basicConfig(level=default_level)
+
+    root = logging.getLogger()
+    files = [handler for handler in root.handlers if isinstance(handler, logging.FileHandler)]
+    if files:
+        for handler in files:
+            root.removeHandler(handler)
+        root.addHandler(QueueHandler(files))
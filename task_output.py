@@ -0,0 +1,80 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import gzip
+import time
+import functools
+
+from fabric.state import env
+from fabric.context_managers import hide
+
+import telemetry
+import background
+
+# Directory of this run, the output of the commands of each task going to <host>/<task>.<pid>.log.gz, one file per
+# process so that the processes forked for the steps never append to the same archive, see configure()
+_directory = None
+_verbose = False
+# Open files of the writer threads, by process and path: those inherited from the parent are left to it
+_files = {}
+
+
+def configure(directory, verbose):
+    """Write the output of the remote commands of this run, and of the processes forked from it, into directory"""
+    global _directory, _verbose
+    _directory = os.path.join(directory, '%s-%d' % (time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+    _verbose = verbose
+    return _directory
+
+
+def directory():
+    return _directory
+
+
+def verbose():
+    return _verbose or str(env.get('verbose', '')).lower() in ('1', 'true', 'yes')
+
+
+def capturing(operation, kind):
+    """Wrap a Fabric operation (run, sudo) so that its output goes to the file of its task instead of the console
+
+    Failures are still reported on the console by Fabric, with the output of the command. A command aborting the
+    run, on failure or on a lost connection, is written along with the error before the abort goes on.
+    """
+    @functools.wraps(operation)
+    def wrapper(*args, **kwargs):
+        if _directory is None or verbose():
+            return operation(*args, **kwargs)
+        command = telemetry.redact(kwargs.get('command', args[0] if args else ''))
+        with hide('running', 'stdout'):
+            try:
+                result = operation(*args, **kwargs)
+            except BaseException as e:
+                _writer.put((env.host or 'local', telemetry.current_task() or 'fabfile', kind, command, None,
+                             ('aborted: %s %s' % (e.__class__.__name__, e)).strip()))
+                raise
+        _writer.put((env.host or 'local', telemetry.current_task() or 'fabfile', kind, command, result.return_code,
+                     str(result)))
+        return result
+    return wrapper
+
+
+def _write(item):
+    host, task, kind, command, return_code, output = item
+    path = os.path.join(_directory, host, '%s.%d.log.gz' % (task, os.getpid()))
+    key = (os.getpid(), path)
+    if key not in _files:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        _files[key] = gzip.open(path, 'ab')
+    _files[key].write('%s %s: %s\n[exit %s]\n%s\n\n' % (time.strftime('%H:%M:%S'), kind, command, return_code,
+                                                      output))
+
+
+def _close():
+    for key in [key for key in _files if key[0] == os.getpid()]:
+        _files.pop(key).close()
+
+
+_writer = background.Worker(_write, _close)
@@ -0,0 +1,108 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import socket
+import hashlib
+import tempfile
+import unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(TESTS)
+sys.path.insert(0, REPOSITORY)
+sys.path.insert(0, os.path.join(REPOSITORY, 'benchmarks'))
+
+import standins
+import downloads
+
+CONTENT = os.urandom(100 * 1024 + 7)
+
+
+class RangesTest(unittest.TestCase):
+
+    def test_segments_of_equal_length_but_the_last(self):
+        self.assertEqual(downloads.ranges(10, 3), [(0, 3), (4, 7), (8, 9)])
+
+    def test_single_segment(self):
+        self.assertEqual(downloads.ranges(10, 1), [(0, 9)])
+
+    def test_fewer_bytes_than_segments(self):
+        self.assertEqual(downloads.ranges(2, 5), [(0, 0), (1, 1)])
+
+    def test_ranges_cover_the_file_once(self):
+        for size in (1, 99, 100, 101, 1024 * 1024 + 1):
+            for segments in (1, 2, 3, 4, 7):
+                ranges = downloads.ranges(size, segments)
+                self.assertEqual(ranges[0][0], 0)
+                self.assertEqual(ranges[-1][1], size - 1)
+                self.assertTrue(all(first == last + 1 for (_, last), (first, _) in zip(ranges, ranges[1:])))
+                self.assertLessEqual(len(ranges), segments)
+
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        root = os.path.join(self.directory, 'root')
+        os.makedirs(root)
+        with open(os.path.join(root, 'artefact.zip'), 'wb') as f:
+            f.write(CONTENT)
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        self.server = standins.serve(root, port)
+        self.url = 'http://127.0.0.1:%d/artefact.zip' % port
+        self.path = os.path.join(self.directory, 'download', 'artefact.zip')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def _downloaded(self):
+        with open(self.path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def test_head(self):
+        self.assertEqual(downloads.head(self.url), (len(CONTENT), True))
+
+    def test_segments_assembled(self):
+        downloads.download(self.url, self.path, len(CONTENT), 4)
+
+        self.assertEqual(self._downloaded(), hashlib.sha256(CONTENT).hexdigest())
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['artefact.zip'])
+
+    def test_interrupted_segments_resumed(self):
+        ranges = downloads.ranges(len(CONTENT), 3)
+        os.makedirs(os.path.dirname(self.path))
+        # First part complete, second one half downloaded, third one missing
+        with open(self.path + '.0', 'wb') as f:
+            f.write(CONTENT[ranges[0][0]:ranges[0][1] + 1])
+        with open(self.path + '.1', 'wb') as f:
+            f.write(CONTENT[ranges[1][0]:ranges[1][0] + 1000])
+
+        downloads.download(self.url, self.path, len(CONTENT), 3)
+
+        self.assertEqual(self._downloaded(), hashlib.sha256(CONTENT).hexdigest())
+
+    def test_oversized_part_downloaded_again(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path + '.0', 'wb') as f:
+            f.write(os.urandom(len(CONTENT)))
+
+        downloads.download(self.url, self.path, len(CONTENT), 2)
+
+        self.assertEqual(self._downloaded(), hashlib.sha256(CONTENT).hexdigest())
+
+    def test_shell_command_checks_the_hash(self):
+        command = downloads.shell_command(self.url, 'artefact.zip', len(CONTENT), 2, sha256='0' * 64)
+
+        self.assertIn('--start-pos=$((0 + have))', command)
+        self.assertIn('= "%s"' % ('0' * 64), command)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import sys
+import copy
+import unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(TESTS)
+sys.path.insert(0, REPOSITORY)
+
+import yaml
+
+import manifest
+
+with open(os.path.join(REPOSITORY, 'resources', 'install_conf.yaml'), 'r') as f:
+    CONFIG = yaml.safe_load(f)
+
+
+class ValidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.properties = copy.deepcopy(CONFIG)
+
+    def _error(self):
+        try:
+            manifest.validate(self.properties)
+        except manifest.ManifestError as e:
+            return str(e)
+        return None
+
+    def test_shipped_configuration(self):
+        self.assertIsNone(self._error())
+
+    def test_missing_key(self):
+        del self.properties['maven']['version']
+
+        self.assertEqual(self._error(), 'maven/version is missing')
+
+    def test_empty_optional_key(self):
+        self.properties['proxy']['host'] = None
+        self.properties['oh-my-zsh']['plugins'] = None
+
+        self.assertIsNone(self._error())
+
+    def test_wrong_type(self):
+        self.properties['cache']['max_size_mb'] = 'a lot'
+
+        self.assertEqual(self._error(), "cache/max_size_mb: 'a lot' is not of the expected type")
+
+    def test_number_is_not_a_flag(self):
+        self.properties['cache']['enabled'] = 1
+
+        self.assertEqual(self._error(), 'cache/enabled: 1 is not of the expected type')
+
+    def test_flag_is_not_a_number(self):
+        self.properties['prefetch']['workers'] = True
+
+        self.assertEqual(self._error(), 'prefetch/workers: True is not of the expected type')
+
+    def test_keys_of_every_section_of_a_wildcard(self):
+        self.properties['scheduler']['locks']['dpkg'] = 'one'
+
+        self.assertEqual(self._error(), "scheduler/locks/dpkg: 'one' is not of the expected type")
+
+    def test_section_expected(self):
+        self.properties['jvm']['profiles'] = 'default'
+
+        self.assertEqual(self._error(), "jvm/profiles: a section is expected, not 'default'")
+
+    def test_url_template_not_matching_its_values(self):
+        self.properties['maven']['url'] = self.properties['maven']['url'] + '/%s/%s/%s/%s'
+
+        self.assertRaises(manifest.ManifestError, manifest.compile_properties, yaml.safe_dump(self.properties))
+
+
+if __name__ == '__main__':
+    unittest.main()
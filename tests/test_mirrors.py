@@ -0,0 +1,145 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import socket
+import hashlib
+import tempfile
+import threading
+import unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(TESTS)
+sys.path.insert(0, REPOSITORY)
+sys.path.insert(0, os.path.join(REPOSITORY, 'benchmarks'))
+
+try:
+    from SocketServer import ThreadingTCPServer
+except ImportError:
+    from socketserver import ThreadingTCPServer
+
+import mirrors
+import standins
+import artefact_cache
+
+CONTENT = os.urandom(256 * 1024)
+
+
+def _free_port():
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+def _serve(root, delay=0):
+    port = _free_port()
+    return standins.serve(root, port, delay), 'http://127.0.0.1:%d' % port
+
+
+def _serve_truncated(root):
+    """Server announcing the whole file but closing the connection halfway through it"""
+    served = root
+
+    class Handler(standins._QuietHandler):
+        root = served
+
+        def copyfile(self, source, outputfile):
+            outputfile.write(source.read(len(CONTENT) // 2))
+
+    port = _free_port()
+    ThreadingTCPServer.allow_reuse_address = True
+    server = ThreadingTCPServer(('127.0.0.1', port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:%d' % port
+
+
+class MirrorsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.root = os.path.join(self.directory, 'root')
+        os.makedirs(os.path.join(self.root, 'dist'))
+        with open(os.path.join(self.root, 'dist', 'artefact.tar.gz'), 'wb') as f:
+            f.write(CONTENT)
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.directory)
+
+    def _serve(self, serve, *args):
+        server, base = serve(self.root, *args)
+        self.servers.append(server)
+        return base
+
+    def test_candidates_of_a_url_outside_the_groups(self):
+        self.assertEqual(mirrors.candidates('http://other/a.jar', {'apache': ['http://a/', 'http://b/']}),
+                         [(None, 'http://other/a.jar')])
+
+    def test_candidates_on_every_mirror_of_the_group(self):
+        self.assertEqual(mirrors.candidates('http://a/dist/x.tar.gz', {'apache': ['http://a/', 'http://b']}),
+                         [('http://a/', 'http://a/dist/x.tar.gz'), ('http://b', 'http://b/dist/x.tar.gz')])
+
+    def test_fastest_mirror_first_and_unreachable_mirror_last(self):
+        slow = self._serve(_serve, 0.5)
+        fast = self._serve(_serve)
+        down = 'http://127.0.0.1:%d' % _free_port()
+        ranking = mirrors.MirrorRanking(os.path.join(self.directory, 'mirrors.json'), 3600, 1024)
+
+        ordered = ranking.ordered(slow + '/dist/artefact.tar.gz', {'group': [down, slow, fast]})
+
+        self.assertEqual(ordered, [fast + '/dist/artefact.tar.gz', slow + '/dist/artefact.tar.gz',
+                                   down + '/dist/artefact.tar.gz'])
+
+    def test_scores_kept_until_their_ttl(self):
+        slow = self._serve(_serve, 0.5)
+        fast = self._serve(_serve)
+        path = os.path.join(self.directory, 'mirrors.json')
+        mirrors.MirrorRanking(path, 3600, 1024).ordered(fast + '/dist/artefact.tar.gz', {'group': [slow, fast]})
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+
+        # Both mirrors are gone, the ranking read from disk is used as it is
+        ordered = mirrors.MirrorRanking(path, 3600, 1024).ordered(slow + '/dist/artefact.tar.gz',
+                                                                  {'group': [slow, fast]})
+        self.assertEqual(ordered, [fast + '/dist/artefact.tar.gz', slow + '/dist/artefact.tar.gz'])
+
+        # Once expired, they are probed again and found unreachable, in the order of the group
+        ordered = mirrors.MirrorRanking(path, 0, 1024).ordered(fast + '/dist/artefact.tar.gz',
+                                                               {'group': [slow, fast]})
+        self.assertEqual(ordered, [fast + '/dist/artefact.tar.gz', slow + '/dist/artefact.tar.gz'])
+
+    def test_next_mirror_after_a_download_failing_halfway(self):
+        broken = self._serve(_serve_truncated)
+        good = self._serve(_serve)
+        cache = artefact_cache.ArtefactCache(os.path.join(self.directory, 'cache'), 1024 * 1024 * 1024)
+        url = broken + '/dist/artefact.tar.gz'
+
+        path = cache.fetch(url, sources=[url, good + '/dist/artefact.tar.gz'])
+
+        with open(path, 'rb') as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), hashlib.sha256(CONTENT).hexdigest())
+        self.assertEqual([name for name in os.listdir(cache.directory) if name.endswith('.part')], [])
+
+    def test_no_artefact_when_every_mirror_fails(self):
+        broken = self._serve(_serve_truncated)
+        down = 'http://127.0.0.1:%d' % _free_port()
+        cache = artefact_cache.ArtefactCache(os.path.join(self.directory, 'cache'), 1024 * 1024 * 1024)
+        url = broken + '/dist/artefact.tar.gz'
+
+        self.assertRaises(Exception, cache.fetch, url, sources=[url, down + '/dist/artefact.tar.gz'])
+        self.assertIsNone(cache.lookup(url))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/python2.7
+#-*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(TESTS)
+sys.path.insert(0, REPOSITORY)
+
+import scheduler
+
+
+def _succeed():
+    pass
+
+
+def _fail():
+    # As a Fabric abort does
+    sys.exit(1)
+
+
+def _sleep():
+    time.sleep(0.5)
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def _statuses(self, nodes, graph, capacities=None, workers=4):
+        results = scheduler.run(nodes, graph, capacities or {}, workers)
+        return dict((result.name, result.status) for result in results)
+
+    def test_steps_after_a_failed_one_are_skipped(self):
+        graph = {'b': {'after': ['a']}, 'c': {'after': ['b']}, 'd': {'after': []}}
+
+        statuses = self._statuses([('a', _fail), ('b', _succeed), ('c', _succeed), ('d', _succeed)], graph)
+
+        self.assertEqual(statuses, {'a': 'failed', 'b': 'skipped', 'c': 'skipped', 'd': 'success'})
+
+    def test_dependencies_outside_the_nodes_are_ignored(self):
+        statuses = self._statuses([('b', _succeed)], {'b': {'after': ['a']}})
+
+        self.assertEqual(statuses, {'b': 'success'})
+
+    def test_results_in_the_order_of_the_nodes(self):
+        results = scheduler.run([('a', _succeed), ('b', _succeed)], {'a': {'after': ['b']}}, {}, 2)
+
+        self.assertEqual([result.name for result in results], ['a', 'b'])
+        self.assertGreaterEqual(results[0].start, results[1].end)
+
+    def test_steps_holding_a_lock_do_not_overlap(self):
+        graph = {'a': {'locks': ['apt']}, 'b': {'locks': ['apt']}}
+
+        a, b = sorted(scheduler.run([('a', _sleep), ('b', _sleep)], graph, {'apt': 1}, 2),
+                      key=lambda result: result.start)
+
+        self.assertGreaterEqual(b.start, a.end)
+
+    def test_dependency_cycle(self):
+        graph = {'a': {'after': ['b']}, 'b': {'after': ['a']}}
+
+        self.assertRaises(scheduler.SchedulerError, scheduler.run, [('a', _succeed), ('b', _succeed)], graph, {}, 1)
+
+    def test_capacities_below_one(self):
+        nodes = [('a', _succeed)]
+
+        self.assertRaises(scheduler.SchedulerError, scheduler.run, nodes, {'a': {'locks': ['apt']}}, {'apt': 0}, 1)
+        self.assertRaises(scheduler.SchedulerError, scheduler.run, nodes, {}, {}, 0)
+
+    def test_critical_path_follows_the_last_finished_dependency(self):
+        results = [scheduler.TaskResult('a', 'success', 0, 1), scheduler.TaskResult('b', 'success', 0, 3),
+                   scheduler.TaskResult('c', 'success', 3, 4)]
+
+        path = scheduler.critical_path(results, {'c': {'after': ['a', 'b']}})
+
+        self.assertEqual([result.name for result in path], ['b', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()